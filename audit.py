@@ -0,0 +1,163 @@
+"""Append-only audit log of tag accesses, kept in SQLite.
+
+Callers hand records to AuditLog.record(), which only puts them on a
+bounded queue; a background thread commits them in groups, so a tag write
+never waits on the disk. The database runs in WAL mode and is indexed on
+(uid, time) and time for query().
+
+Set ``NFC_AUDIT_DB`` to choose the file (default ``~/nfc_audit.db``, so
+the log does not move with the working directory); an empty value turns
+the log off.
+"""
+import atexit
+import hashlib
+import os
+import queue
+import threading
+import time
+
+
+FIELDS = ("time", "uid", "operator", "patient_id", "device_id", "payload_hash", "apdus", "duration_ms", "result")
+
+# Values of ``result``: what the tap did and how it ended.
+RESULTS = ("uid_read", "read", "written", "failed", "error", "verified", "not_verified", "denied")
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), "nfc_audit.db")
+
+# Records waiting for the writer; when full, new records are dropped and counted.
+MAX_QUEUE = 10000
+
+# Records per transaction, and how long the writer waits to fill one.
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    time REAL NOT NULL,
+    uid TEXT NOT NULL,
+    operator TEXT,
+    patient_id TEXT,
+    device_id TEXT,
+    payload_hash TEXT,
+    apdus INTEGER,
+    duration_ms REAL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS audit_uid_time ON audit (uid, time);
+CREATE INDEX IF NOT EXISTS audit_time ON audit (time);
+"""
+
+# Sentinel that tells the writer to flush and exit.
+_STOP = object()
+
+
+def payload_hash(ndef_message) -> str:
+    """SHA-256 of the NDEF image, as hex."""
+    return hashlib.sha256(ndef_message).hexdigest()
+
+
+def _connect(path):
+    import sqlite3  # Kept off the import path of the headless commands
+
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(_SCHEMA)
+    return db
+
+
+class AuditLog:
+    """Non-blocking writer for the audit table; see the module docstring."""
+
+    def __init__(self, path, max_queue=MAX_QUEUE):
+        self.path = path
+        self.records = queue.Queue(max_queue)
+        self.dropped = 0
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def record(self, uid, result, operator="", patient_id="", device_id="", ndef_message=None,
+               apdus=None, duration=None):
+        """Queues one tag operation (``result`` is one of RESULTS); ``duration`` is in seconds."""
+        if not self.path:
+            return
+        if self.writer is None:
+            self._start()
+        row = (
+            time.time(),
+            bytes(uid).hex().upper() if isinstance(uid, (bytes, bytearray, list)) else str(uid or ""),
+            operator,
+            patient_id,
+            device_id,
+            payload_hash(ndef_message) if ndef_message is not None else None,
+            apdus,
+            round(duration * 1000, 3) if duration is not None else None,
+            result,
+        )
+        try:
+            self.records.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write, name="nfc-audit", daemon=True)
+                self.writer.start()
+                atexit.register(self.close)
+
+    def _write(self):
+        db = _connect(self.path)
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self.records.get(timeout=FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                batch.remove(_STOP)
+                stopping = True
+            if batch:
+                with db:  # One transaction per group
+                    db.executemany(f"INSERT INTO audit VALUES ({', '.join('?' * len(FIELDS))})", batch)
+        db.close()
+
+    def close(self, timeout=5.0):
+        """Flushes queued records and stops the writer."""
+        writer = self.writer
+        if writer is None or not writer.is_alive():
+            return
+        self.records.put(_STOP)
+        writer.join(timeout)
+
+    def query(self, uid=None, since=None, until=None, limit=1000):
+        """Returns audit records as dicts, newest first.
+
+        ``uid`` is hex text or bytes; ``since``/``until`` are Unix times.
+        Records still on the queue are not visible yet.
+        """
+        clauses, params = [], []
+        if uid is not None:
+            clauses.append("uid = ?")
+            params.append(bytes(uid).hex().upper() if isinstance(uid, (bytes, bytearray)) else uid.upper())
+        if since is not None:
+            clauses.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("time < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        db = _connect(self.path)
+        try:
+            rows = db.execute(f"SELECT * FROM audit {where} ORDER BY time DESC LIMIT ?", (*params, limit)).fetchall()
+        finally:
+            db.close()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+
+audit = AuditLog(os.getenv("NFC_AUDIT_DB", DEFAULT_PATH))
@@ -0,0 +1,236 @@
+"""Batch provisioning: job rows pre-encoded and handed out one per tag."""
+import collections
+import csv
+import json
+import os
+import threading
+import time
+
+from audit import audit
+from journal import journal, write_resumable
+from tagcache import tag_cache
+from ntag import COMPACT_FIELDS, CapacityError, create_compact_record, create_ndef_record, write_ndef_message
+
+
+# Job file columns, in the order they appear on the tag.
+DETAIL_FIELDS = (
+    ("patient_id", "Patient ID"),
+    ("zip_code", "ZIP Code"),
+    ("device_id", "Device ID"),
+)
+
+
+def format_details(patient_id, zip_code, device_id) -> str:
+    """Builds the tag text for one patient/device entry."""
+    values = (patient_id, zip_code, device_id)
+    return "\n".join(f"{label}: {value}" for (_, label), value in zip(DETAIL_FIELDS, values))
+
+
+def row_text(row) -> str:
+    """Returns the tag text for a job row (a ``text`` column wins)."""
+    if row.get("text"):
+        return row["text"]
+    return format_details(*(row.get(key, "") for key, _ in DETAIL_FIELDS))
+
+
+def details_fields(text) -> dict:
+    """Splits tag text back into fields; lines that are not details become ``text``."""
+    labels = {label: key for key, label in DETAIL_FIELDS}
+    fields = {}
+    other = []
+    for line in text.splitlines():
+        label, sep, value = line.partition(": ")
+        if sep and label in labels:
+            fields[labels[label]] = value.strip()
+        elif line.strip():
+            other.append(line)
+    if other:
+        fields["text"] = "\n".join(other)
+    return fields
+
+
+def encode_row(row, compact=False) -> bytes:
+    """Encodes a job row as a TLV image: a TextRecord, or a compact record."""
+    if compact:
+        fields = {key: row.get(key) for key, _ in COMPACT_FIELDS}
+        return create_compact_record(fields, "dictionary")
+    return create_ndef_record(row_text(row))
+
+
+def load_rows(path):
+    """Reads job rows from a .csv (with header) or .jsonl file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+
+class BatchJob:
+    """Queue of pre-encoded NDEF messages, one per job row.
+
+    Every row is encoded when the job is loaded (or comes precompiled from a
+    tag image file, see images.py) so a tap only has to write. take() hands
+    out the next row and record() logs the outcome to ``results_path`` as
+    JSON lines; failed rows go back to the front of the queue so the next
+    tag retries them. Rows with a ``uid`` column only go to that tag, until
+    one is written there (or cannot fit it); remaining() counts them too.
+    """
+
+    def __init__(self, rows, results_path=None, images=None, compact=False):
+        self.rows = rows
+        self.results_path = results_path
+        self.retry = collections.deque()
+        self.cursor = 0
+        self.done = 0
+        self.failed = 0
+        self.operator = ""  # Logged-in user, for the audit log
+        self.lock = threading.Lock()
+        self.finished = set()  # Targeted rows that are no longer handed out
+        if images is not None:
+            self.messages = images
+            self.available = images.sequential
+            self.targets_left = images.uid_count
+            return
+        self.messages = []
+        self.targets = {}
+        for index, row in enumerate(rows):
+            try:
+                self.messages.append(encode_row(row, compact))
+            except (ValueError, OverflowError) as e:
+                self.messages.append(None)
+                self.record(index, False, f"Encode failed: {e}", requeue=False)
+                continue
+            if row.get("uid"):
+                self.targets[bytes.fromhex(row["uid"])] = index
+        targeted = sum(1 for index, row in enumerate(rows) if row.get("uid") and self.messages[index] is not None)
+        self.available = sum(1 for message in self.messages if message is not None) - targeted
+        self.targets_left = len(self.targets)
+
+    @classmethod
+    def from_file(cls, path, compact=False):
+        """Loads a job file; results go next to it as ``<name>.results.jsonl``.
+
+        A ``.nfcimg`` file is memory-mapped instead of parsed and encoded
+        (``compact`` was chosen when it was compiled).
+        """
+        results_path = os.path.splitext(path)[0] + ".results.jsonl"
+        if path.lower().endswith(".nfcimg"):
+            from images import TagImageFile
+
+            return cls([], results_path, TagImageFile(path))
+        return cls(load_rows(path), results_path, compact=compact)
+
+    def find_uid(self, uid):
+        """Returns the row still waiting for ``uid``, or None."""
+        if isinstance(self.messages, list):
+            return self.targets.get(bytes(uid))
+        index = self.messages.find_uid(uid)
+        return index if index not in self.finished else None
+
+    def targeted(self, index) -> bool:
+        if isinstance(self.messages, list):
+            return bool(self.rows[index].get("uid"))
+        return self.messages.targeted(index)
+
+    def take(self, tag_uid=None):
+        """Returns ``(index, ndef_message)`` for the next row, or None when done.
+
+        A row targeted at ``tag_uid`` (hex) comes first.
+        """
+        with self.lock:
+            if tag_uid:
+                index = self.find_uid(bytes.fromhex(tag_uid))
+                if index is not None:
+                    return index, self.messages[index]
+            if self.retry:
+                index = self.retry.popleft()
+                return index, self.messages[index]
+            while self.cursor < len(self.messages):
+                index = self.cursor
+                self.cursor += 1
+                message = self.messages[index]
+                if message is not None and not self.targeted(index):
+                    self.available -= 1
+                    return index, message
+            return None
+
+    def finish_target(self, index):
+        """Stops handing out targeted row ``index``."""
+        with self.lock:
+            if index in self.finished:
+                return
+            self.finished.add(index)
+            self.targets_left -= 1
+            if isinstance(self.messages, list):
+                self.targets.pop(bytes.fromhex(self.rows[index]["uid"]), None)
+
+    def row(self, index) -> dict:
+        if not isinstance(self.messages, list):
+            return self.messages.row(index)
+        return self.rows[index] if index < len(self.rows) else {}
+
+    def record(self, index, ok, message="", uid=None, requeue=True):
+        """Logs the outcome of one row."""
+        with self.lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+                if requeue:
+                    self.retry.appendleft(index)
+            if self.results_path:
+                entry = {"row": index, "uid": uid, "ok": ok, "message": message, "time": time.time()}
+                with open(self.results_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def write_next(self, connection, tag_uid=None, diff=False):
+        """Writes the next queued row to the tag.
+
+        Returns ``(written, message)`` where ``message`` is for the operator.
+        """
+        job = self.take(tag_uid)
+        if job is None:
+            return False, "Batch complete. No rows left."
+        index, ndef_message = job
+        # A row meant for one tag must never be retried on another
+        requeue = not self.targeted(index)
+        stats = {}
+        started = time.perf_counter()
+        written = False
+        try:
+            if tag_uid and not diff:
+                written = write_resumable(connection, bytes.fromhex(tag_uid), ndef_message, journal, stats)
+            else:
+                written = write_ndef_message(connection, ndef_message, stats, diff=diff)
+        except CapacityError as e:
+            # Will not fit this tag type; do not hand it to the next tag either
+            self.record(index, False, str(e), tag_uid, requeue=False)
+            if not requeue:
+                self.finish_target(index)
+            result, message = str(e), f"Row {index + 1} skipped: {e}"
+        except Exception as e:
+            # Tag left the field mid-write; keep the row for the next tap
+            self.record(index, False, f"Error: {e}", tag_uid, requeue)
+            result, message = f"Error: {e}", f"Row {index + 1} interrupted: {e}"
+        else:
+            if written:
+                self.record(index, True, f"{stats['apdus']} APDUs", tag_uid)
+                if not requeue:
+                    self.finish_target(index)
+                result, message = "written", f"Row {index + 1} written. {self.remaining()} left."
+            else:
+                self.record(index, False, "Write failed", tag_uid, requeue)
+                result, message = "failed", f"Row {index + 1} failed, it will go to the next tag."
+        if tag_uid:
+            if written:
+                tag_cache.put(bytes.fromhex(tag_uid), ndef_message)
+            else:
+                tag_cache.forget(bytes.fromhex(tag_uid))
+        row = self.row(index)
+        audit.record(tag_uid, result, self.operator, row.get("patient_id", ""), row.get("device_id", ""),
+                     ndef_message, stats.get("apdus"), time.perf_counter() - started)
+        return written, message
+
+    def remaining(self) -> int:
+        with self.lock:
+            return len(self.retry) + self.available + self.targets_left
@@ -0,0 +1,169 @@
+"""Tap-to-write throughput benchmark on the simulated reader (no hardware).
+
+    python benchmark.py --out bench.json [--apdu-latency-ms 3] [--taps 20]
+
+For each payload size it times encoding, counts APDUs, records per-APDU
+latency percentiles and derives tags per minute, for both the per-page
+write path and the FAST_WRITE path, plus the UID check alone. Results are
+saved as JSON so releases can be compared.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from ntag import GET_UID_COMMAND, create_ndef_record, write_ndef_message
+from simulator import SimulatedNTAG215, SimulatedNTAGI2C, SimulatedReader
+from uid_list import AccessControl, UIDList
+
+
+PAYLOAD_SIZES = (16, 64, 128, 256, 400)
+
+# Card and capabilities per write path; the per-page card refuses multi-page
+# commands, and only the NTAG I2C takes FAST_WRITE.
+WRITE_PATHS = {
+    "per_page": (SimulatedNTAG215, dict(multi_block=False)),
+    "fast_write": (SimulatedNTAGI2C, dict(multi_block=True)),
+}
+
+# Allowlist size used for the UID check path.
+ALLOWLIST_SIZE = 100_000
+
+
+class TimedTransport:
+    """Wraps a connection and records the latency of every transmit().
+
+    Like a ReaderSession it remembers the write mode between taps of its
+    one tag.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.write_mode = None
+        self.latencies = []
+
+    def transmit(self, command):
+        started = time.perf_counter()
+        try:
+            return self.connection.transmit(command)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(seconds):
+    return {f"p{int(p * 100)}": round(percentile(seconds, p) * 1e6, 1) for p in (0.5, 0.9, 0.99)}
+
+
+def new_transport(latency, card=SimulatedNTAG215, **capabilities):
+    reader = SimulatedReader("Benchmark Reader", card(latency=latency, **capabilities))
+    connection = reader.createConnection()
+    connection.connect()
+    return TimedTransport(connection)
+
+
+def bench_write(path, payload_size, taps, latency):
+    text = "x" * payload_size
+    encode_times = []
+    tap_times = []
+    apdu_counts = []
+    card, capabilities = WRITE_PATHS[path]
+    transport = new_transport(latency, card, **capabilities)
+    for _ in range(taps):
+        started = time.perf_counter()
+        ndef_message = create_ndef_record(text)
+        encoded = time.perf_counter()
+        transport.transmit(GET_UID_COMMAND)
+        stats = {}
+        if not write_ndef_message(transport, ndef_message, stats):
+            raise RuntimeError(f"{path} write of {payload_size} bytes failed")
+        tap_times.append(time.perf_counter() - started)
+        encode_times.append(encoded - started)
+        apdu_counts.append(stats["apdus"] + 1)
+    tap_mean = sum(tap_times) / len(tap_times)
+    return {
+        "path": path,
+        "payload_bytes": payload_size,
+        "tlv_bytes": len(ndef_message),
+        "mode": stats["mode"],
+        # Steady state; the first tap also pays for choosing the write mode.
+        "apdus": apdu_counts[-1],
+        "first_tap_apdus": apdu_counts[0],
+        "encode_us": round(sum(encode_times) / len(encode_times) * 1e6, 1),
+        "apdu_latency_us": latency_summary(transport.latencies),
+        "tap_ms": round(tap_mean * 1000, 3),
+        "tags_per_minute": round(60 / tap_mean, 1),
+    }
+
+
+def bench_uid_check(taps, latency):
+    allowlist = UIDList(uids=(i.to_bytes(7, "big") for i in range(ALLOWLIST_SIZE)))
+    access = AccessControl(allowlist)
+    transport = new_transport(latency)
+    lookups = []
+    tap_times = []
+    for _ in range(taps):
+        started = time.perf_counter()
+        response, _, _ = transport.transmit(GET_UID_COMMAND)
+        looked_up = time.perf_counter()
+        access.is_allowed(bytes(response))
+        finished = time.perf_counter()
+        lookups.append(finished - looked_up)
+        tap_times.append(finished - started)
+    tap_mean = sum(tap_times) / len(tap_times)
+    return {
+        "path": "uid_check",
+        "allowlist_size": ALLOWLIST_SIZE,
+        "apdus": 1,
+        "lookup_us": latency_summary(lookups),
+        "apdu_latency_us": latency_summary(transport.latencies),
+        "tap_ms": round(tap_mean * 1000, 3),
+        "tags_per_minute": round(60 / tap_mean, 1),
+    }
+
+
+def run(taps=20, latency=0.0, sizes=PAYLOAD_SIZES):
+    results = [bench_uid_check(taps, latency)]
+    for path in WRITE_PATHS:
+        for size in sizes:
+            results.append(bench_write(path, size, taps, latency))
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "taps": taps,
+        "apdu_latency_ms": latency * 1000,
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--taps", type=int, default=20, help="taps per measurement")
+    parser.add_argument("--apdu-latency-ms", type=float, default=0.0,
+                        help="simulated reader round trip per APDU")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(PAYLOAD_SIZES),
+                        help="payload sizes in characters")
+    args = parser.parse_args(argv)
+
+    report = run(args.taps, args.apdu_latency_ms / 1000, args.sizes)
+    for result in report["results"]:
+        size = result.get("payload_bytes", "-")
+        print(f"{result['path']:>10} {size!s:>5} B  {result['apdus']:4d} APDUs  "
+              f"{result['tap_ms']:9.3f} ms/tap  {result['tags_per_minute']:10.1f} tags/min")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
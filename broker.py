@@ -0,0 +1,471 @@
+"""Local reader broker: one process owns the readers, any number of clients share them.
+
+    python -m nfc_cli broker            # serve until Ctrl+C
+    client = BrokerClient()
+    client.call("uid")                  # {"uid": "04A1B2C3D4E5F6", "reader": ...}
+    client.call("write", text="hello")
+    for event in client.events():       # card arrivals and removals
+        ...
+
+Clients talk newline-delimited JSON over a Unix socket (``NFC_BROKER_SOCKET``,
+default ``/tmp/nfc-broker.sock``) or, where Unix sockets are missing,
+localhost TCP on ``NFC_BROKER_PORT``. A request is
+``{"id": 1, "op": "uid", "reader": "...", ...}`` and its answer
+``{"id": 1, "ok": true, "result": {...}}`` or ``{"id": 1, "ok": false,
+"error": "..."}``. Requests run one at a time per reader, most urgent
+first (see PRIORITIES), on the reader's warm session.
+"""
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from smartcard.CardMonitoring import CardMonitor, CardObserver
+from smartcard.System import readers
+
+from audit import audit
+from batch import BatchJob, details_fields
+from ntag import (GET_UID_COMMAND, CapacityError, create_compact_record, create_ndef_record, format_records,
+                  write_ndef_message)
+from presence import ReaderPresence
+from session import sessions
+from tagcache import tag_cache
+
+
+SOCKET_PATH = os.getenv("NFC_BROKER_SOCKET", "/tmp/nfc-broker.sock")
+PORT = int(os.getenv("NFC_BROKER_PORT", "7531"))
+
+# Lower runs first: quick interactive checks jump ahead of long batch writes.
+PRIORITIES = {"uid": 0, "read": 1, "write": 2, "batch": 3}
+
+# Sentinel that tells a reader queue to exit.
+_STOP = object()
+
+
+class BrokerError(Exception):
+    """Reported back to the client as ``{"ok": false, "error": ...}``."""
+
+
+class _Job:
+    def __init__(self, op, params):
+        self.op = op
+        self.params = params
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ReaderQueue(threading.Thread):
+    """Runs one reader's requests in priority order, one at a time.
+
+    Once stopped, requests still queued or submitted later fail at once
+    instead of waiting for a reader that is gone.
+    """
+
+    def __init__(self, broker, reader_name):
+        super().__init__(name=f"broker {reader_name}", daemon=True)
+        self.broker = broker
+        self.reader_name = reader_name
+        self.jobs = queue.PriorityQueue()
+        self.order = itertools.count()  # FIFO among equal priorities
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def submit(self, job, priority):
+        with self.lock:
+            if not self.closed:
+                self.jobs.put((priority, next(self.order), job))
+                return
+        job.error = f"Reader {self.reader_name!r} is gone."
+        job.done.set()
+
+    def stop(self):
+        self.jobs.put((-1, next(self.order), _STOP))
+
+    def run(self):
+        while True:
+            _, _, job = self.jobs.get()
+            if job is _STOP:
+                break
+            try:
+                job.result = self.broker.run_op(self.reader_name, job.op, job.params)
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+            job.done.set()
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                _, _, job = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is not _STOP:
+                job.error = f"Reader {self.reader_name!r} is gone."
+                job.done.set()
+
+
+class Broker:
+    """Owns the readers: per-reader request queues plus card event fan-out."""
+
+    def __init__(self, access=None):
+        self.access = access
+        self.queues = {}
+        self.subscribers = set()
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.monitor = None
+        self.observer = None
+        self.presence = None
+
+    def readers(self):
+        return [str(reader) for reader in readers()]
+
+    def queue_for(self, reader_name=None) -> ReaderQueue:
+        """The reader's queue, started on first use; unknown names raise BrokerError."""
+        if reader_name is None:
+            names = self.readers()
+            if not names:
+                raise BrokerError("No reader attached.")
+            reader_name = names[0]
+        elif reader_name not in self.queues and not self._attached(reader_name):
+            # Every queue is a thread for good: only real readers get one.
+            raise BrokerError(f"Unknown reader {reader_name!r}.")
+        with self.lock:
+            reader_queue = self.queues.get(reader_name)
+            if reader_queue is None:
+                reader_queue = self.queues[reader_name] = ReaderQueue(self, reader_name)
+                reader_queue.start()
+            return reader_queue
+
+    def _attached(self, reader_name):
+        # Sessions cover readers bound by hand, such as simulated ones.
+        return reader_name in sessions.sessions or reader_name in self.readers()
+
+    def readers_changed(self, added, removed):
+        """Stops the queues and closes the sessions of detached readers."""
+        for reader_name in removed:
+            with self.lock:
+                reader_queue = self.queues.pop(reader_name, None)
+            if reader_queue is not None:
+                reader_queue.stop()
+            sessions.close(reader_name)
+
+    def request(self, op, params, timeout=None):
+        """Queues ``op`` on its reader and waits for the result."""
+        if op not in PRIORITIES:
+            raise BrokerError(f"Unknown op {op!r}.")
+        try:
+            priority = int(params.get("priority", PRIORITIES[op]))
+        except (TypeError, ValueError):
+            raise BrokerError("The priority must be a number.")
+        job = _Job(op, params)
+        self.queue_for(params.get("reader")).submit(job, priority)
+        if not job.done.wait(timeout):
+            raise BrokerError("Timed out waiting for the reader.")
+        if job.error is not None:
+            raise BrokerError(job.error)
+        return job.result
+
+    def run_op(self, reader_name, op, params):
+        """Does one request on the reader's session; runs on its ReaderQueue."""
+        started = time.perf_counter()
+        session = sessions.get(reader_name)
+        response, sw1, sw2 = session.transmit(GET_UID_COMMAND)
+        if sw1 != 0x90 or sw2 != 0x00:
+            raise BrokerError("No tag on the reader.")
+        uid = bytes(response)
+        result = {"reader": reader_name, "uid": uid.hex().upper()}
+        operator = params.get("operator", "")
+        if op == "uid":
+            audit.record(uid, "uid_read", operator, apdus=1, duration=time.perf_counter() - started)
+            return result
+        # Tag contents are patient data: reads need an allowed tag just like writes.
+        if self.access is not None and not self.access.is_allowed(uid):
+            audit.record(uid, "denied", operator, duration=time.perf_counter() - started)
+            raise BrokerError("Wrong NFC tag! Access Denied.")
+        if op == "read":
+            stats = {}
+            records = tag_cache.read_ndef_records(session, uid, stats)
+            audit.record(uid, "read", operator, apdus=stats.get("apdus"), duration=time.perf_counter() - started)
+            result.update(text=format_records(records) if records is not None else None, apdus=stats.get("apdus"))
+            return result
+        if op == "write":
+            return self._write(session, uid, params, result)
+        if not params.get("jobfile"):
+            raise BrokerError("A batch request needs a jobfile.")
+        batch = self._batch(params["jobfile"], params.get("compact", False))
+        written, message = batch.write_next(session, result["uid"], diff=params.get("diff", False))
+        result.update(written=written, message=message, remaining=batch.remaining())
+        return result
+
+    def _write(self, session, uid, params, result):
+        text = params.get("text", "")
+        if not text:
+            raise BrokerError("No text to write.")
+        if params.get("compact"):
+            ndef_message = create_compact_record(details_fields(text), "dictionary")
+        else:
+            ndef_message = create_ndef_record(text)
+        stats = {}
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            written = write_ndef_message(session, ndef_message, stats, diff=params.get("diff", False),
+                                         verify=params.get("verify", False))
+            outcome = "written" if written else "failed"
+        except CapacityError as e:
+            raise BrokerError(str(e))
+        finally:
+            audit.record(uid, outcome, params.get("operator", ""), params.get("patient_id", ""),
+                         params.get("device_id", ""), ndef_message, stats.get("apdus"),
+                         time.perf_counter() - started)
+        if written:
+            tag_cache.put(uid, ndef_message)
+        else:
+            tag_cache.forget(uid)
+        result.update(written=written, apdus=stats.get("apdus"))
+        return result
+
+    def _batch(self, path, compact):
+        with self.lock:
+            batch = self.batches.get(path)
+            if batch is None:
+                batch = self.batches[path] = BatchJob.from_file(path, compact=compact)
+            return batch
+
+    # Card events
+
+    def subscribe(self, send):
+        with self.lock:
+            self.subscribers.add(send)
+
+    def unsubscribe(self, send):
+        with self.lock:
+            self.subscribers.discard(send)
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for send in subscribers:
+            try:
+                send(event)
+            except OSError:
+                self.unsubscribe(send)
+
+    def start(self):
+        """Starts watching for cards on every reader, and for readers going away."""
+        self.monitor = CardMonitor()
+        self.observer = _CardEvents(self)
+        self.monitor.addObserver(self.observer)
+        self.presence = ReaderPresence(self.readers_changed)
+        self.presence.start()
+
+    def stop(self):
+        if self.monitor is not None:
+            self.monitor.deleteObserver(self.observer)
+        if self.presence is not None:
+            self.presence.stop()
+        with self.lock:
+            reader_queues = list(self.queues.values())
+            self.queues.clear()
+        for reader_queue in reader_queues:
+            reader_queue.stop()
+        sessions.close()
+
+
+class _CardEvents(CardObserver):
+    """Turns CardMonitor updates into broker events; the UID read goes through the queue."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def update(self, observable, actions):
+        added, removed = actions
+        for card in added:
+            threading.Thread(target=self._arrived, args=(str(card.reader),), daemon=True).start()
+        for card in removed:
+            self.broker.publish({"event": "removed", "reader": str(card.reader)})
+
+    def _arrived(self, reader_name):
+        try:
+            result = self.broker.request("uid", {"reader": reader_name}, timeout=5)
+        except BrokerError as e:
+            self.broker.publish({"event": "card", "reader": reader_name, "error": str(e)})
+            return
+        self.broker.publish({"event": "card", **result})
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self.send_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def handle(self):
+        broker = self.server.broker
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    self.send({"ok": False, "error": "Bad JSON."})
+                    continue
+                if not isinstance(request, dict):
+                    self.send({"ok": False, "error": "A request must be a JSON object."})
+                    continue
+                # Each request gets its own thread so a slow write does not
+                # hold up this client's quick UID checks on another reader.
+                threading.Thread(target=self._answer, args=(broker, request), daemon=True).start()
+        finally:
+            broker.unsubscribe(self.send)
+
+    def _answer(self, broker, request):
+        op = request.pop("op", None)
+        reply = {"id": request.pop("id", None)}
+        try:
+            if op == "subscribe":
+                broker.subscribe(self.send)
+                reply.update(ok=True, result=None)
+            elif op == "readers":
+                reply.update(ok=True, result=broker.readers())
+            else:
+                reply.update(ok=True, result=broker.request(op, request))
+        except BrokerError as e:
+            reply.update(ok=False, error=str(e))
+        except Exception as e:
+            # Anything else still gets an answer, or the client would wait forever.
+            reply.update(ok=False, error=f"{type(e).__name__}: {e}")
+        try:
+            self.send(reply)
+        except OSError:
+            pass  # Client went away
+
+
+if hasattr(socket, "AF_UNIX"):
+    class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    class _Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+
+def serve(broker=None, path=SOCKET_PATH, port=PORT):
+    """Runs the broker until interrupted."""
+    broker = broker or Broker()
+    if hasattr(socket, "AF_UNIX"):
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        server = _Server(path, _Handler)
+        os.chmod(path, 0o600)
+    else:
+        server = _Server(("127.0.0.1", port), _Handler)
+    server.broker = broker
+    broker.start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        broker.stop()
+        if hasattr(socket, "AF_UNIX") and os.path.exists(path):
+            os.unlink(path)
+
+
+def _remove_stale_socket(path):
+    """Removes a socket left over from a broker that did not shut down.
+
+    Raises BrokerError if a broker is still answering on it.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)  # Nobody listening
+        return
+    finally:
+        probe.close()
+    raise BrokerError(f"A broker is already running on {path}.")
+
+
+class BrokerClient:
+    """Blocking client for the broker; safe to share between threads."""
+
+    def __init__(self, path=SOCKET_PATH, port=PORT, timeout=None):
+        if hasattr(socket, "AF_UNIX"):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.settimeout(timeout)
+        self.rfile = self.sock.makefile("rb")
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.replies = {}
+        self.closed = False
+        self.events_queue = queue.Queue()
+        self.reader = threading.Thread(target=self._read, name="broker-client", daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        try:
+            for line in self.rfile:
+                message = json.loads(line)
+                if "event" in message:
+                    self.events_queue.put(message)
+                    continue
+                with self.lock:
+                    waiter = self.replies.pop(message.get("id"), None)
+                if waiter is not None:
+                    waiter.append(message)
+                    waiter[0].set()
+        except (OSError, ValueError):
+            pass  # Socket closed under us, or the broker sent garbage
+        finally:
+            # Nothing more will arrive: fail the calls still waiting.
+            with self.lock:
+                self.closed = True
+                waiters = list(self.replies.values())
+                self.replies.clear()
+            for waiter in waiters:
+                waiter.append({"ok": False, "error": "Broker connection closed."})
+                waiter[0].set()
+            self.events_queue.put(None)
+
+    def call(self, op, timeout=None, **params):
+        """Sends one request and returns its result; raises BrokerError on failure."""
+        request_id = next(self.ids)
+        waiter = [threading.Event()]
+        with self.lock:
+            if self.closed:
+                raise BrokerError("Broker connection closed.")
+            self.replies[request_id] = waiter
+            self.sock.sendall((json.dumps({"id": request_id, "op": op, **params}) + "\n").encode("utf-8"))
+        if not waiter[0].wait(timeout):
+            raise BrokerError("Timed out waiting for the broker.")
+        reply = waiter[1]
+        if not reply["ok"]:
+            raise BrokerError(reply["error"])
+        return reply["result"]
+
+    def events(self):
+        """Yields card events as dicts until the connection closes."""
+        self.call("subscribe")
+        while True:
+            event = self.events_queue.get()
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,103 @@
+"""Per-reader worker threads feeding one result stream."""
+import collections
+import queue
+import threading
+import time
+
+
+TagEvent = collections.namedtuple("TagEvent", "reader message elapsed")
+
+# Sentinel that tells a worker to exit.
+_STOP = object()
+
+# Seconds remove_reader() waits for a worker to finish its current tag.
+JOIN_TIMEOUT = 5.0
+
+
+class ReaderWorker(threading.Thread):
+    """Handles the card events of a single reader, one at a time."""
+
+    def __init__(self, reader_name, handle_card, events):
+        super().__init__(name=f"reader-worker {reader_name}", daemon=True)
+        self.reader_name = reader_name
+        self.handle_card = handle_card
+        self.events = events
+        self.jobs = queue.Queue()
+
+    def run(self):
+        while True:
+            card = self.jobs.get()
+            if card is _STOP:
+                return
+            started = time.perf_counter()
+            try:
+                message = self.handle_card(self.reader_name, card)
+            except Exception as e:
+                message = f"Error: {e}"
+            if message:
+                self.events.put(TagEvent(self.reader_name, message, time.perf_counter() - started))
+
+
+class ReaderDispatcher:
+    """Runs one ReaderWorker per reader so tags on different readers are
+    handled in parallel, and funnels every result into ``events``.
+
+    ``handle_card(reader_name, card)`` does the per-tag work and returns a
+    status message (or None). ``on_event(event)`` is called for each result
+    from a single collector thread, in completion order. readers_changed()
+    fits ReaderPresence, so workers come and go with their readers.
+    """
+
+    def __init__(self, handle_card, on_event=None, reader_names=()):
+        self.handle_card = handle_card
+        self.on_event = on_event
+        self.events = queue.Queue()
+        self.workers = {}
+        self.lock = threading.Lock()
+        for reader_name in reader_names:
+            self.add_reader(reader_name)
+        if on_event is not None:
+            threading.Thread(target=self._collect, name="reader-events", daemon=True).start()
+
+    def add_reader(self, reader_name) -> ReaderWorker:
+        """Starts a worker for ``reader_name`` if it does not have one yet."""
+        reader_name = str(reader_name)
+        with self.lock:
+            worker = self.workers.get(reader_name)
+            if worker is None:
+                worker = self.workers[reader_name] = ReaderWorker(reader_name, self.handle_card, self.events)
+                worker.start()
+            return worker
+
+    def remove_reader(self, reader_name, timeout=JOIN_TIMEOUT):
+        """Stops the worker of a detached reader and waits for it to exit."""
+        with self.lock:
+            worker = self.workers.pop(str(reader_name), None)
+        if worker is not None:
+            worker.jobs.put(_STOP)
+            if worker is not threading.current_thread():
+                worker.join(timeout)
+
+    def readers_changed(self, added, removed):
+        """Starts workers for attached readers and stops those of detached ones."""
+        for reader_name in added:
+            self.add_reader(reader_name)
+        for reader_name in removed:
+            self.remove_reader(reader_name)
+
+    def submit(self, reader_name, card):
+        """Queues a card event on its reader's worker."""
+        self.add_reader(reader_name).jobs.put(card)
+
+    def stop(self):
+        """Stops all workers and the collector."""
+        for reader_name in list(self.workers):
+            self.remove_reader(reader_name)
+        self.events.put(_STOP)
+
+    def _collect(self):
+        while True:
+            event = self.events.get()
+            if event is _STOP:
+                return
+            self.on_event(event)
@@ -0,0 +1,194 @@
+"""Precompiled tag images: a whole job encoded ahead of time into one file.
+
+    python images.py jobs.csv jobs.nfcimg [--workers N] [--compact]
+
+The compiler encodes every job row in a process pool. The write station
+memory-maps the result and hands ``memoryview`` slices of it to the page
+writer, so a tap does no encoding and no copying, and opening a file of
+millions of rows only reads its header.
+
+Layout (little endian):
+
+    header     magic "NFCIMG2\\0", row count, UID entry count and count of
+               encoded untargeted rows (u32 each)
+    row index  per row: image offset (u32), image length (u16), flags (u16),
+               details offset (u32), details length (u16)
+    UID index  sorted entries: UID length (u8), UID padded to 10 bytes, row (u32), pad
+    images     TLV images, each starting on a page boundary
+    details    per row, the DETAIL_COLUMNS it had, as compact JSON
+
+A row whose image length is 0 failed to encode. Rows with a ``uid``
+column are only written to that tag and are skipped by sequential takes;
+only encoded ones are in the UID index, the last row winning for a UID.
+"""
+import argparse
+import bisect
+import functools
+import json
+import mmap
+import struct
+import sys
+
+from batch import encode_row, load_rows
+from ntag import PAGE_SIZE
+
+
+MAGIC = b"NFCIMG2\x00"
+HEADER = struct.Struct("<8sIII")
+ROW_ENTRY = struct.Struct("<IHHIH")
+UID_ENTRY = struct.Struct("<B10sIx")
+UID_KEY_SIZE = 11
+
+# Row flag: the row carries a target UID.
+FLAG_TARGETED = 0x01
+
+# Job columns kept next to the images for the audit log.
+DETAIL_COLUMNS = ("patient_id", "device_id")
+
+
+def uid_key(uid) -> bytes:
+    """Sort key of a UID entry: its length byte and the zero-padded UID."""
+    uid = bytes(uid)
+    return bytes([len(uid)]) + uid.ljust(10, b"\x00")
+
+
+def _encode_row(row, compact=False):
+    try:
+        return encode_row(row, compact)
+    except (ValueError, OverflowError):
+        return None
+
+
+def compile_rows(rows, path, workers=None, chunksize=256, compact=False) -> int:
+    """Encodes ``rows`` into an image file at ``path``; returns the row count.
+
+    Rows are dicts as loaded by batch.load_rows(); an optional ``uid``
+    column (hex) targets the row at one tag. ``compact`` encodes compact
+    records instead of TextRecords.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    rows = list(rows)
+    with ProcessPoolExecutor(workers) as pool:
+        images = list(pool.map(functools.partial(_encode_row, compact=compact), rows, chunksize=chunksize))
+
+    targets = sorted({
+        uid_key(bytes.fromhex(row["uid"])): index
+        for index, (row, image) in enumerate(zip(rows, images)) if row.get("uid") and image
+    }.items())
+    details = [
+        json.dumps({key: str(row[key]) for key in DETAIL_COLUMNS if row.get(key)},
+                   separators=(",", ":")).encode("utf-8")
+        for row in rows
+    ]
+    offset = HEADER.size + ROW_ENTRY.size * len(rows) + UID_ENTRY.size * len(targets)
+    offset += -offset % PAGE_SIZE
+    details_offset = offset + sum(len(image or b"") for image in images)
+    row_entries = []
+    for row, image, row_details in zip(rows, images, details):
+        flags = FLAG_TARGETED if row.get("uid") else 0
+        row_entries.append(ROW_ENTRY.pack(offset, len(image or b""), flags, details_offset, len(row_details)))
+        offset += len(image or b"")  # TLV images are whole pages already
+        details_offset += len(row_details)
+
+    with open(path, "wb") as f:
+        sequential = sum(1 for row, image in zip(rows, images) if image and not row.get("uid"))
+        f.write(HEADER.pack(MAGIC, len(rows), len(targets), sequential))
+        f.writelines(row_entries)
+        for key, index in targets:
+            f.write(UID_ENTRY.pack(key[0], key[1:], index))
+        f.write(b"\x00" * (-f.tell() % PAGE_SIZE))
+        f.writelines(image for image in images if image)
+        f.writelines(details)
+    return len(rows)
+
+
+class TagImageFile:
+    """Read-only, memory-mapped view of a compiled image file.
+
+    Indexing returns a ``memoryview`` of a row's TLV image, or None for a
+    row that failed to encode. Release the slices before close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, self.count, self.uid_count, self.sequential = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a tag image file")
+        self.uid_start = HEADER.size + ROW_ENTRY.size * self.count
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, index):
+        """Returns ``(offset, length, flags, details_offset, details_length)`` for row ``index``."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return ROW_ENTRY.unpack_from(self.map, HEADER.size + ROW_ENTRY.size * index)
+
+    def __getitem__(self, index):
+        offset, length = self.entry(index)[:2]
+        return self.view[offset:offset + length] if length else None
+
+    def targeted(self, index) -> bool:
+        return bool(self.entry(index)[2] & FLAG_TARGETED)
+
+    def row(self, index) -> dict:
+        """Returns the DETAIL_COLUMNS of row ``index`` as a dict."""
+        offset, length = self.entry(index)[3:]
+        return json.loads(self.map[offset:offset + length]) if length else {}
+
+    def find_uid(self, uid):
+        """Returns the row targeted at ``uid``, or None."""
+        key = uid_key(uid)
+        keys = _UIDKeys(self)
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            return UID_ENTRY.unpack_from(self.map, self.uid_start + UID_ENTRY.size * position)[2]
+        return None
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _UIDKeys:
+    """Sequence view of the sorted UID keys, for bisect."""
+
+    def __init__(self, images):
+        self.images = images
+
+    def __len__(self):
+        return self.images.uid_count
+
+    def __getitem__(self, position):
+        start = self.images.uid_start + UID_ENTRY.size * position
+        return self.images.map[start:start + UID_KEY_SIZE]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a CSV/JSONL job file into a tag image file.")
+    parser.add_argument("jobfile")
+    parser.add_argument("output")
+    parser.add_argument("--workers", type=int, default=None, help="encoder processes (default: CPU count)")
+    parser.add_argument("--compact", action="store_true", help="encode compact records instead of text")
+    args = parser.parse_args(argv)
+    count = compile_rows(load_rows(args.jobfile), args.output, args.workers, compact=args.compact)
+    with TagImageFile(args.output) as images:
+        print(f"Compiled {count} rows into {args.output} ({images.sequential} for any tag, "
+              f"{images.uid_count} for named tags).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""APDU tracing: per-command latency histograms around every transmit().
+
+Set ``NFC_METRICS`` to a file path to turn it on; ``.json`` paths get a JSON
+snapshot, anything else the Prometheus text format. The file is rewritten
+every ``NFC_METRICS_INTERVAL`` seconds (default 15). When ``NFC_METRICS`` is
+unset, instrument() hands the connection back untouched, so there is no
+cost at all.
+"""
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+
+from ntag import COMMUNICATE_THRU, DIRECT_TRANSMIT, FAST_READ, FAST_WRITE, GET_VERSION
+
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1.0)
+
+# Recent APDUs kept for the JSON export.
+TRACE_SIZE = 256
+
+_PCSC_COMMANDS = {0xCA: "get_uid", 0xB0: "read_binary", 0xD6: "update_binary"}
+_NATIVE_COMMANDS = {0x30: "read", 0xA2: "write", 0x39: "read_cnt", FAST_READ: "fast_read", FAST_WRITE: "fast_write",
+                    GET_VERSION: "get_version"}
+
+
+def is_direct_transmit(command) -> bool:
+    """True for a raw tag frame sent through the direct-transmit pseudo-APDU."""
+    command = list(command)
+    return command[:4] == DIRECT_TRANSMIT and command[5:7] == COMMUNICATE_THRU
+
+
+def classify(command):
+    """Returns ``(command_class, page)`` for an APDU; page is None if n/a."""
+    command = list(command)
+    if is_direct_transmit(command) and len(command) > 7:
+        name = _NATIVE_COMMANDS.get(command[7], "direct")
+        return name, command[8] if len(command) > 8 and name not in ("read_cnt", "get_version") else None
+    if len(command) > 3 and command[0] == 0xFF and command[1] in _PCSC_COMMANDS:
+        name = _PCSC_COMMANDS[command[1]]
+        return name, command[3] if name != "get_uid" else None
+    return "other", None
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class Metrics:
+    """In-memory APDU statistics shared by every instrumented connection."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = collections.defaultdict(Histogram)  # (reader, command) -> Histogram
+        self.status = collections.Counter()  # (reader, command, "9000") -> count
+        self.pages = collections.Counter()  # (command, page) -> count
+        self.trace = collections.deque(maxlen=TRACE_SIZE)
+
+    def record(self, reader, command, page, sw, seconds):
+        with self.lock:
+            self.latency[reader, command].observe(seconds)
+            self.status[reader, command, sw] += 1
+            if page is not None:
+                self.pages[command, page] += 1
+            self.trace.append((time.time(), reader, command, page, sw, round(seconds * 1e6)))
+
+    def prometheus_text(self) -> str:
+        lines = ["# TYPE nfc_apdu_seconds histogram"]
+        with self.lock:
+            for (reader, command), hist in sorted(self.latency.items()):
+                labels = f'reader="{reader}",command="{command}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, hist.counts):
+                    cumulative += count
+                    lines.append(f'nfc_apdu_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'nfc_apdu_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"nfc_apdu_seconds_sum{{{labels}}} {hist.total:.6f}")
+                lines.append(f"nfc_apdu_seconds_count{{{labels}}} {hist.count}")
+            lines.append("# TYPE nfc_apdu_status_total counter")
+            for (reader, command, sw), count in sorted(self.status.items()):
+                lines.append(f'nfc_apdu_status_total{{reader="{reader}",command="{command}",sw="{sw}"}} {count}')
+            lines.append("# TYPE nfc_apdu_page_total counter")
+            for (command, page), count in sorted(self.pages.items()):
+                lines.append(f'nfc_apdu_page_total{{command="{command}",page="{page}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "buckets": list(BUCKETS),
+                "latency": [
+                    {"reader": reader, "command": command, "counts": hist.counts,
+                     "sum": round(hist.total, 6), "count": hist.count}
+                    for (reader, command), hist in sorted(self.latency.items())
+                ],
+                "status": [
+                    {"reader": reader, "command": command, "sw": sw, "count": count}
+                    for (reader, command, sw), count in sorted(self.status.items())
+                ],
+                "recent": [
+                    dict(zip(("time", "reader", "command", "page", "sw", "us"), entry))
+                    for entry in self.trace
+                ],
+            }
+
+    def export(self, path):
+        """Writes the metrics to ``path`` atomically."""
+        if path.endswith(".json"):
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.prometheus_text()
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+
+class InstrumentedConnection:
+    """Times every transmit() of the wrapped connection; other calls pass through."""
+
+    def __init__(self, connection, reader_name, metrics):
+        self.connection = connection
+        self.reader_name = reader_name
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def transmit(self, command, *args, **kwargs):
+        started = time.perf_counter()
+        sw = "error"
+        try:
+            response, sw1, sw2 = self.connection.transmit(command, *args, **kwargs)
+            sw = f"{sw1:02X}{sw2:02X}"
+            if is_direct_transmit(command) and len(response) > 2 and response[0] == 0xD5 and response[2]:
+                # Reader was fine but the tag did not answer the direct-transmit frame.
+                sw += f"/{response[2]:02X}"
+            return response, sw1, sw2
+        finally:
+            command_class, page = classify(command)
+            self.metrics.record(self.reader_name, command_class, page, sw, time.perf_counter() - started)
+
+
+class _Exporter(threading.Thread):
+    def __init__(self, metrics, path, interval):
+        super().__init__(name="nfc-metrics", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.metrics.export(self.path)
+            except OSError:
+                pass  # Try again next interval
+
+
+metrics = None
+_setup_lock = threading.Lock()
+
+
+def enable(path=None, interval=15.0) -> Metrics:
+    """Turns instrumentation on, exporting to ``path`` every ``interval`` s."""
+    global metrics
+    with _setup_lock:
+        if metrics is None:
+            metrics = Metrics()
+            if path:
+                _Exporter(metrics, path, interval).start()
+        return metrics
+
+
+def instrument(connection, reader_name=""):
+    """Wraps ``connection`` when instrumentation is on; otherwise returns it."""
+    if metrics is None:
+        return connection
+    return InstrumentedConnection(connection, reader_name, metrics)
+
+
+if os.getenv("NFC_METRICS"):
+    enable(os.environ["NFC_METRICS"], float(os.getenv("NFC_METRICS_INTERVAL", "15")))
@@ -0,0 +1,142 @@
+"""Resumable tag writes backed by a per-UID write journal."""
+import collections
+import json
+import os
+import threading
+
+from ntag import (BLANK_DIGEST, EMPTY_NDEF_PAGE, PAGE_SIZE, USER_START_PAGE, PageReader, PageWriter,
+                  check_capacity, digest_page, image_digest, read_tag_info)
+
+
+# Interrupted writes remembered at most; the oldest are dropped first.
+MAX_ENTRIES = 1000
+
+
+class WriteJournal:
+    """Remembers how far an interrupted write got, per tag UID and payload.
+
+    Entries are keyed on the UID and the image digest, so a re-tap only
+    resumes when the same tag is getting the same data. With ``path`` the
+    journal survives restarts; it is saved when a write is interrupted or
+    completes, not on every page.
+    """
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries.update(json.load(f))
+
+    @staticmethod
+    def key(uid, digest):
+        return f"{bytes(uid).hex()}:{digest.hex()}"
+
+    def get(self, uid, digest):
+        """Returns the next page to write for this tag and payload, or None."""
+        with self.lock:
+            return self.entries.get(self.key(uid, digest))
+
+    def update(self, uid, digest, next_page):
+        with self.lock:
+            key = self.key(uid, digest)
+            self.entries[key] = next_page
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._save()
+
+    def clear(self, uid, digest):
+        with self.lock:
+            if self.entries.pop(self.key(uid, digest), None) is not None:
+                self._save()
+
+    def forget(self, uid):
+        """Drops every entry for ``uid``; its journaled pages are about to be overwritten."""
+        prefix = f"{bytes(uid).hex()}:"
+        with self.lock:
+            keys = [key for key in self.entries if key.startswith(prefix)]
+            for key in keys:
+                del self.entries[key]
+            if keys:
+                self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+
+def write_resumable(connection, uid, ndef_message, journal, stats=None, tag_info=None, verify=False) -> bool:
+    """Writes ``ndef_message`` so that an interrupted write can be resumed.
+
+    A fresh write first replaces the TLV header page with an empty NDEF
+    TLV (clearing the digest before that with ``verify``), then writes the
+    body, and writes the real header page last, so a half-written tag
+    always reads as empty rather than corrupt and never passes
+    verify_ndef_digest(). If the
+    tag leaves the field, the last acknowledged page is journaled; the next
+    tap of the same UID with the same payload continues from there. A fresh
+    write drops every other journal entry for the UID.
+    """
+    ndef_message = memoryview(ndef_message)  # Slices of a mapped image file stay zero-copy
+    digest = image_digest(ndef_message)
+    reader = PageReader(connection)
+    if tag_info is None:
+        tag_info = read_tag_info(reader)
+    check_capacity(ndef_message, tag_info, verify)
+    writer = PageWriter(connection, tag_info=tag_info)
+
+    next_page = journal.get(uid, digest)
+    if next_page is not None:
+        # Only trust the journal if the tag is still marked as in progress.
+        block = reader.read_block(USER_START_PAGE, 1)
+        if block is None or block[:PAGE_SIZE] != EMPTY_NDEF_PAGE:
+            next_page = None
+    resumed = next_page is not None
+    if not resumed:
+        # A fresh write overwrites whatever another payload left half-written,
+        # so none of this tag's other entries describe its pages any more.
+        journal.forget(uid)
+
+    success = False
+    try:
+        if next_page is None:
+            if verify:
+                try:
+                    cleared = writer.write(digest_page(tag_info), BLANK_DIGEST)
+                finally:
+                    writer.next_page = None  # Digest pages are not body progress
+                if not cleared:
+                    return False
+            if not writer.write(USER_START_PAGE, EMPTY_NDEF_PAGE):
+                return False
+            next_page = USER_START_PAGE + 1
+        writer.next_page = next_page
+        body = ndef_message[(next_page - USER_START_PAGE) * PAGE_SIZE:]
+        if body and not writer.write(next_page, body):
+            return False
+        # Body is on the tag; the header page makes it valid.
+        success = writer.write(USER_START_PAGE, ndef_message[:PAGE_SIZE])
+        if success and verify:
+            success = writer.write(digest_page(tag_info), digest)
+        return success
+    finally:
+        # writer.next_page is the page after the last acknowledged body page.
+        if success:
+            journal.clear(uid, digest)
+        elif writer.next_page is not None:
+            journal.update(uid, digest, writer.next_page)
+        if stats is not None:
+            stats["apdus"] = reader.apdus + writer.apdus
+            stats["resumed_from"] = next_page if resumed else None
+            stats["mode"] = writer.mode
+
+
+# Shared journal; persisted when NFC_JOURNAL names a file.
+journal = WriteJournal(os.getenv("NFC_JOURNAL"))
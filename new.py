@@ -1,46 +1,22 @@
 import wx
-import threading
-import time
-from smartcard.System import readers
-from smartcard.util import toHexString
-import ndef
-from smartcard.CardConnection import CardConnection
-from smartcard.CardMonitoring import CardMonitor, CardObserver
-import os
-import hashlib
-import tkinter as tk
-from tkinter import Text, Label, Button
-from dotenv import load_dotenv
+from smartcard.CardMonitoring import CardMonitor
 
+from presence import ReaderPresence
+from session import sessions
+from batch import BatchJob, format_details
+from tag_observer import NTAG215Observer, load_access
+from ui_bus import UIBus
+from patients import patients
+from ntag import format_records
 
 
-#  Set the correct UID in uppercase format
-EXPECTED_UID = "1DD94F118D0000"
-
-class NFCReader:
-    def __init__(self):
-        self.clf = None
-
-    def is_device_connected(self):
-        """Checks if the NFC device is connected."""
-        try:
-            self.clf = nfc.ContactlessFrontend('usb')
-            return True
-        except Exception:
-            return False
-        finally:
-            if self.clf:
-                self.clf.close()
+#  Allow/deny lists; loaded on startup, not on import, since a bad list exits
+access = None
 
 class MainFrame(wx.Frame):
     def __init__(self):
         super().__init__(None, title="NFC App", size=(400, 300))
         self.panel = wx.Panel(self)
-        self.nfc_reader = NFCReader()
-        
-        self.timer = wx.Timer(self)  # Timer to check device status
-        self.Bind(wx.EVT_TIMER, self.check_device_status, self.timer)
-        self.timer.Start(2000)  # Check every 2 seconds
 
         self.sizer = wx.BoxSizer(wx.VERTICAL)
         self.SetSizer(self.sizer)
@@ -55,10 +31,21 @@ class MainFrame(wx.Frame):
         self.show_device_not_found_page()
         self.Show()
 
-    def check_device_status(self, event):
-        """Continuously checks if the device is still connected."""
-        if not self.nfc_reader.is_device_connected():
-            self.show_device_not_found_page()
+        # Reader attach/detach events arrive on the presence thread
+        self.reader_presence = ReaderPresence(self.on_readers_changed)
+        self.reader_presence.start()
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+    def on_readers_changed(self, added, removed):
+        """Called from the presence thread when readers come or go."""
+        if removed and not self.reader_presence.is_connected():
+            wx.CallAfter(self.show_device_not_found_page)
+        for reader_name in removed:
+            sessions.close(reader_name)
+
+    def OnClose(self, event):
+        self.reader_presence.stop()
+        event.Skip()
 
     def show_device_not_found_page(self):
         """Shows the Device Not Found page when the device is disconnected."""
@@ -68,7 +55,7 @@ class MainFrame(wx.Frame):
 
     def show_nfc_scanning_page(self):
         """Shows the NFC Scanning Page when the device is connected."""
-        if self.nfc_reader.is_device_connected():
+        if self.reader_presence.is_connected():
             self.device_not_found_page.Hide()
             self.nfc_scanning_page.Show()
             self.Layout()
@@ -146,6 +133,7 @@ class LoginFrame(wx.Frame):
             wx.MessageBox('Login Successful!', 'Info', wx.OK | wx.ICON_INFORMATION)
             self.Close()
             details = DetailsFrame(None)
+            details.operator = username
             details.Show()
         else:
             wx.MessageBox('Invalid credentials!', 'Error', wx.OK | wx.ICON_ERROR)
@@ -154,6 +142,7 @@ class LoginFrame(wx.Frame):
 class DetailsFrame(wx.Frame):
     def __init__(self, *args, **kw):
         super(DetailsFrame, self).__init__(*args, **kw)
+        self.operator = ""
         self.InitUI()
 
     def InitUI(self):
@@ -182,20 +171,32 @@ class DetailsFrame(wx.Frame):
         submit_btn = wx.Button(panel, label="SUBMIT", pos=(150, 170))
         submit_btn.Bind(wx.EVT_BUTTON, self.OnSubmit)
 
+        # Fill ZIP Code and Device ID from the local patient records
+        self.patient_id_txt.Bind(wx.EVT_TEXT, self.OnPatientID)
+
         self.SetSize((400, 250))
         self.Centre()
 
+    def OnPatientID(self, event):
+        record = patients.lookup(self.patient_id_txt.GetValue())
+        if record is not None:
+            self.zip_code_txt.ChangeValue(record.zip_code)
+            self.device_id_txt.ChangeValue(record.device_id)
+
     def OnSubmit(self, event):
         patient_id = self.patient_id_txt.GetValue()
         zip_code = self.zip_code_txt.GetValue()
         device_id = self.device_id_txt.GetValue()
 
-        if patient_id and zip_code and device_id:
+        error = patients.validate(patient_id, zip_code, device_id)
+        if error is None:
             self.Close()
             nfc_write = WriteNFCFrame(None)  # ✅ Now creating NFCWriteFrame without arguments
+            nfc_write.text_ctrl.SetValue(format_details(patient_id, zip_code, device_id))
+            nfc_write.ui.set_snapshot(operator=self.operator, patient_id=patient_id, device_id=device_id)
             nfc_write.Show()
         else:
-            wx.MessageBox('Please fill all the fields!', 'Error', wx.OK | wx.ICON_ERROR)
+            wx.MessageBox(error, 'Error', wx.OK | wx.ICON_ERROR)
 
 
 class WriteNFCFrame(wx.Frame):
@@ -203,9 +204,6 @@ class WriteNFCFrame(wx.Frame):
         super().__init__(parent, title="Write NFC Data", size=(400, 300))
         self.InitUI()  # Ensure this method exists
 
-
-    EXPECTED_UID = "1DD94F118D0000"
-
     def InitUI(self):
         panel = wx.Panel(self)
         vbox = wx.BoxSizer(wx.VERTICAL)
@@ -220,28 +218,6 @@ class WriteNFCFrame(wx.Frame):
 
         
 
-def create_ndef_record(data: str) -> bytes:
-    """Encodes text into an NDEF message for NFC writing."""
-    record = ndef.TextRecord(data)
-    encoded_message = b''.join(ndef.message_encoder([record]))
-    message_length = len(encoded_message)
-    initial_message = b'\x03' + message_length.to_bytes(1, 'big') + encoded_message + b'\xFE'
-    padding_length = -len(initial_message) % 4
-    return initial_message + (b'\x00' * padding_length)
-
-def write_ndef_message(connection, ndef_message: bytes) -> bool:
-    """Writes the NDEF message to the NFC tag."""
-    page = 4
-    while ndef_message:
-        block_data = ndef_message[:4]
-        ndef_message = ndef_message[4:]
-        WRITE_COMMAND = [0xFF, 0xD6, 0x00, page, 0x04] + list(block_data)
-        response, sw1, sw2 = connection.transmit(WRITE_COMMAND)
-        if sw1 != 0x90 or sw2 != 0x00:
-            return False  # Failed to write
-        page += 1
-    return True  # Success
-
 class WriteNFCFrame(wx.Frame):
     def __init__(self, parent):
         super().__init__(parent, title="NFC Writer", size=(400, 300))
@@ -269,17 +245,63 @@ class WriteNFCFrame(wx.Frame):
         vbox.Add(self.write_button, flag=wx.ALL | wx.CENTER, border=10)
         self.write_button.Bind(wx.EVT_BUTTON, self.OnWriteNFC)
 
+        # Rewrite only the pages that differ from what is on the tag
+        self.diff_checkbox = wx.CheckBox(panel, label="Only rewrite changed pages")
+        vbox.Add(self.diff_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Store a digest with the data; a tag that already matches is not rewritten
+        self.verify_checkbox = wx.CheckBox(panel, label="Verify with digest")
+        vbox.Add(self.verify_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Pack the details into a compact record; fewer pages to write
+        self.compact_checkbox = wx.CheckBox(panel, label="Compact record")
+        vbox.Add(self.compact_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Write even if this tag just got the same data a moment ago
+        self.force_checkbox = wx.CheckBox(panel, label="Force rewrite")
+        vbox.Add(self.force_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Read Button
+        self.read_button = wx.Button(panel, label="Read from NFC")
+        vbox.Add(self.read_button, flag=wx.ALL | wx.CENTER, border=10)
+        self.read_button.Bind(wx.EVT_BUTTON, self.OnReadNFC)
+        self.read_requested = False
+
+        # Batch Button
+        self.batch_button = wx.Button(panel, label="Load Job File")
+        vbox.Add(self.batch_button, flag=wx.ALL | wx.CENTER, border=10)
+        self.batch_button.Bind(wx.EVT_BUTTON, self.OnLoadBatch)
+        self.batch = None
+
         # Status Label
         self.status_label = wx.StaticText(panel, label="", style=wx.ALIGN_CENTER)
         vbox.Add(self.status_label, flag=wx.ALL | wx.CENTER, border=10)
+        self.reader_status = {}  # Last result per reader, shown together
 
         panel.SetSizer(vbox)
 
+        # Card workers never touch widgets; they read this snapshot and post updates back
+        self.ui = UIBus()
+        self.text_ctrl.Bind(wx.EVT_TEXT, self.OnFormChanged)
+        for checkbox in (self.diff_checkbox, self.verify_checkbox, self.compact_checkbox, self.force_checkbox):
+            checkbox.Bind(wx.EVT_CHECKBOX, self.OnFormChanged)
+        self.OnFormChanged(None)
+
         # Start NFC Monitoring
         self.cardmonitor = CardMonitor()
-        self.cardobserver = NTAG215Observer(self)
+        self.cardobserver = NTAG215Observer(self, access)
         self.cardmonitor.addObserver(self.cardobserver)
 
+    def OnFormChanged(self, event):
+        """Publishes the form values and mode the card workers use."""
+        self.ui.set_snapshot(text=self.text_ctrl.GetValue().strip(),
+                             diff=self.diff_checkbox.GetValue(),
+                             verify=self.verify_checkbox.GetValue(),
+                             compact=self.compact_checkbox.GetValue(),
+                             force=self.force_checkbox.GetValue(),
+                             read_requested=self.read_requested,
+                             batch=self.batch)
+
     def OnWriteNFC(self, event):
         """Triggered when 'Write to NFC' button is clicked."""
         data = self.text_ctrl.GetValue().strip()
@@ -287,60 +309,55 @@ class WriteNFCFrame(wx.Frame):
             self.status_label.SetLabel("Please enter text to write.")
             return
 
+        self.read_requested = False
+        self.OnFormChanged(None)
         self.status_label.SetLabel("Waiting for NFC tag...")  # Waiting for tag detection
 
-    def update_status(self, status):
-        """Update the status label with a message."""
-        self.status_label.SetLabel(status)
-
-
-class NTAG215Observer(CardObserver):
-    def __init__(self, app):
-        self.app = app
-
-    def update(self, observable, actions):
-        """Handles the NFC card detection and writing process."""
-        addedcards, _ = actions
-        for card in addedcards:
-            try:
-                connection = card.createConnection()
-                connection.connect()
-
-                # Read NFC tag UID
-                uid_command = [0xFF, 0xCA, 0x00, 0x00, 0x00]
-                response, sw1, sw2 = connection.transmit(uid_command)
-                tag_uid = toHexString(response).replace(" ", "").upper()
-
-                if tag_uid != EXPECTED_UID:
-                    self.app.update_status("Wrong NFC tag! Access Denied.")
-                    return
-
-                # Get text from the text box
-                data = self.app.text_ctrl.GetValue().strip()
-                if not data:
-                    self.app.update_status("No text entered. Please enter text.")
-                    return
+    def OnReadNFC(self, event):
+        """Triggered when 'Read from NFC' button is clicked."""
+        self.read_requested = True
+        self.OnFormChanged(None)
+        self.status_label.SetLabel("Waiting for NFC tag to read...")
+
+    def OnLoadBatch(self, event):
+        """Loads a CSV/JSONL job file; each following tag gets the next row."""
+        with wx.FileDialog(self, "Open job file", wildcard="Job files (*.csv;*.jsonl;*.nfcimg)|*.csv;*.jsonl;*.nfcimg",
+                           style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dialog:
+            if dialog.ShowModal() != wx.ID_OK:
+                return
+            path = dialog.GetPath()
+        try:
+            self.batch = BatchJob.from_file(path, compact=self.compact_checkbox.GetValue())
+            self.batch.operator = self.ui.snapshot().get("operator", "")
+        except (OSError, ValueError) as e:
+            self.status_label.SetLabel(f"Could not load job file: {e}")
+            return
+        self.read_requested = False
+        self.OnFormChanged(None)
+        self.status_label.SetLabel(f"Batch loaded: {self.batch.remaining()} tags to write.")
 
-                # Convert text to NDEF message
-                ndef_message = create_ndef_record(data)
+    def show_records(self, records):
+        """Puts the records read from a tag into the text box."""
+        self.read_requested = False
+        self.OnFormChanged(None)
+        self.text_ctrl.SetValue(format_records(records))
+        self.status_label.SetLabel(f"Read {len(records)} record(s) from tag.")
 
-                # Write to NFC tag
-                if write_ndef_message(connection, ndef_message):
-                    self.app.update_status("Data written successfully!")
-                else:
-                    self.app.update_status("Failed to write to NFC tag.")
+    def update_status(self, status):
+        """Update the status label with a message."""
+        if self.status_label.GetLabel() != status:
+            self.status_label.SetLabel(status)
 
-            except Exception as e:
-                self.app.update_status(f"Error: {e}")
+    def update_reader_status(self, reader, message):
+        """Shows the latest result of every reader, one line each."""
+        self.reader_status[reader] = message
+        self.update_status("\n".join(f"{name}: {text}" for name, text in self.reader_status.items()))
 
-def main():
-    root = tk.Tk()
-    app = NFCApp(root)
-    root.mainloop()
 
 if __name__ == "__main__":
+    access = load_access()
     app = wx.App(False)  # Create the app
     frame = MainFrame()  # Start with the MainPage
     frame.Show()
     app.MainLoop()  # Run the event loop
- 
\ No newline at end of file
+ 
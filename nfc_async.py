@@ -0,0 +1,112 @@
+"""asyncio front end for tag sessions.
+
+The blocking pyscard calls run in a bounded thread pool, so one event loop
+can drive many readers next to its other I/O:
+
+    async with AsyncReader(reader_name) as reader:
+        uid = await reader.wait_for_tag(timeout=10)
+        records = await reader.read_ndef()
+        ok = await reader.write_ndef("hello")
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from presence import CardPresence
+from ntag import GET_UID_COMMAND, create_ndef_record, read_ndef_records, write_ndef_message
+from session import sessions
+
+
+# Shared by every AsyncReader unless one is passed in; caps the number of
+# threads blocked in PC/SC at once.
+MAX_WORKERS = 8
+_executor = None
+_executor_lock = threading.Lock()
+
+# How long one blocking presence check may wait before re-checking for
+# cancellation, in seconds.
+PRESENCE_SLICE = 0.25
+
+
+def default_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="nfc-async")
+        return _executor
+
+
+class AsyncReader:
+    """Awaitable operations on one reader's shared session.
+
+    Calls on the same reader are serialised by an asyncio lock, so a read
+    and a write can never interleave their APDUs. Cancelling an awaiting
+    task stops ``wait_for_tag`` within ``PRESENCE_SLICE``; an operation
+    already in flight on the tag is allowed to finish in its thread, and a
+    timeout or cancellation only returns once it has, so the lock is never
+    released while its APDUs are still going out.
+    """
+
+    def __init__(self, reader_name, executor=None):
+        self.reader_name = str(reader_name)
+        self.session = sessions.get(self.reader_name)
+        self.presence = CardPresence(self.reader_name)
+        self.executor = executor or default_executor()
+        self.lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._run(self.session.disconnect)
+        self.presence.close()
+
+    async def _run(self, func, *args, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, *args)
+        try:
+            # Shielded: a timeout must not detach us from the running thread.
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            if not future.done():
+                await asyncio.wait([future])
+
+    def _try_uid(self):
+        """One blocking UID read; None while no tag answers."""
+        try:
+            response, sw1, sw2 = self.session.transmit(GET_UID_COMMAND)
+        except Exception:
+            self.session.disconnect()
+            return None
+        if sw1 != 0x90 or sw2 != 0x00:
+            return None
+        return bytes(response)
+
+    async def wait_for_tag(self, timeout=None) -> bytes:
+        """Waits until a tag is on the reader and returns its UID.
+
+        Raises asyncio.TimeoutError if none shows up within ``timeout``.
+        """
+        async with self.lock:
+            return await asyncio.wait_for(self._poll_for_tag(), timeout)
+
+    async def _poll_for_tag(self):
+        while True:
+            # Blocks on PC/SC card events for one slice, so a tap is seen at once
+            if await self._run(self.presence.wait, PRESENCE_SLICE):
+                uid = await self._run(self._try_uid)
+                if uid is not None:
+                    return uid
+                await asyncio.sleep(PRESENCE_SLICE)  # Card there but not answering yet
+
+    async def read_ndef(self, timeout=None):
+        """Reads and decodes the NDEF records on the tag (None if there are none)."""
+        async with self.lock:
+            return await self._run(read_ndef_records, self.session, timeout=timeout)
+
+    async def write_ndef(self, payload, diff=False, timeout=None) -> bool:
+        """Writes ``payload`` (text or a ready TLV image) to the tag."""
+        if isinstance(payload, str):
+            payload = create_ndef_record(payload)
+        async with self.lock:
+            return await self._run(write_ndef_message, self.session, payload, None, diff, timeout=timeout)
@@ -0,0 +1,448 @@
+"""Headless entry point for the NFC tool.
+
+    python -m nfc_cli uid [--watch]
+    python -m nfc_cli read
+    python -m nfc_cli write TEXT [--diff] [--verify] [--compact]
+    python -m nfc_cli verify TEXT [--compact]
+    python -m nfc_cli batch JOBFILE [--diff] [--compact]
+    python -m nfc_cli import-patients FILE
+    python -m nfc_cli broker
+    python -m nfc_cli audit [--uid UID] [--since T] [--until T] [--limit N]
+    python -m nfc_cli startup [--budget-ms N] [--json PATH]
+    python -m nfc_cli gui
+
+Only the ``gui`` command imports a GUI toolkit; everything else runs on a
+box without a display. Heavy modules are imported inside the commands so
+``--help`` and the startup check stay cheap.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+# Same default tag as the GUI when no NFC_ALLOWLIST file is configured.
+EXPECTED_UID = "1DD94F118D0000"
+
+# Modules a headless run loads; ``startup`` times exactly this import.
+HEADLESS_MODULES = ("nfc_cli", "ntag", "session", "dispatcher", "batch", "uid_list")
+GUI_MODULES = ("wx", "tkinter")
+
+# Import-time budget for the headless path, in milliseconds.
+STARTUP_BUDGET_MS = float(os.getenv("NFC_STARTUP_BUDGET_MS", "250"))
+
+
+def load_access():
+    from dotenv import load_dotenv
+    from uid_list import UIDListError, load_access_control
+
+    load_dotenv()
+    try:
+        return load_access_control([EXPECTED_UID])
+    except UIDListError as e:
+        raise SystemExit(f"nfc_cli: {e}")
+
+
+def tag_errors():
+    """Exceptions a command reports on one line instead of a traceback."""
+    from smartcard.Exceptions import SmartcardException
+
+    # CapacityError is a ValueError; RuntimeError comes from read_uid().
+    return SmartcardException, OSError, ValueError, RuntimeError
+
+
+def wait_for_card(timeout, new_card_only=False):
+    """Blocks until a card is on any reader; returns its reader name or None."""
+    from smartcard.CardRequest import CardRequest
+    from smartcard.CardType import AnyCardType
+    from smartcard.Exceptions import CardRequestTimeoutException
+
+    request = CardRequest(timeout=timeout, cardType=AnyCardType(), newcardonly=new_card_only)
+    try:
+        service = request.waitforcard()
+    except CardRequestTimeoutException:
+        return None
+    return str(service.connection.getReader())
+
+
+def read_uid(session) -> bytes:
+    from ntag import GET_UID_COMMAND
+
+    response, sw1, sw2 = session.transmit(GET_UID_COMMAND)
+    if sw1 != 0x90 or sw2 != 0x00:
+        raise RuntimeError(f"UID read failed ({sw1:02X} {sw2:02X})")
+    return bytes(response)
+
+
+def log_access(uid, result, started, ndef_message=None, stats=None):
+    """Queues an audit record for this command's tap (see audit.RESULTS)."""
+    from audit import audit
+
+    audit.record(uid, result, ndef_message=ndef_message, apdus=(stats or {}).get("apdus"),
+                 duration=time.perf_counter() - started)
+
+
+def cmd_uid(args):
+    from session import sessions
+
+    new_card_only = False
+    while True:
+        reader_name = wait_for_card(args.timeout, new_card_only)
+        if reader_name is None:
+            print("No tag presented.", file=sys.stderr)
+            return 1
+        started = time.perf_counter()
+        try:
+            uid = read_uid(sessions.get(reader_name))
+        except tag_errors() as e:
+            print(e, file=sys.stderr)
+            return 1
+        log_access(uid, "uid_read", started, stats={"apdus": 1})
+        print(f"{reader_name}: {uid.hex().upper()}", flush=True)
+        if not args.watch:
+            return 0
+        new_card_only = True
+
+
+def cmd_read(args):
+    from ntag import format_records, read_ndef_records
+    from session import sessions
+
+    access = load_access()
+    reader_name = wait_for_card(args.timeout)
+    if reader_name is None:
+        print("No tag presented.", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    session = sessions.get(reader_name)
+    stats = {}
+    try:
+        uid = read_uid(session)
+        if not access.is_allowed(uid):
+            log_access(uid, "denied", started)
+            print("Wrong NFC tag! Access Denied.", file=sys.stderr)
+            return 1
+        records = read_ndef_records(session, stats)
+    except tag_errors() as e:
+        print(e, file=sys.stderr)
+        return 1
+    log_access(uid, "read", started, stats=stats)
+    if records is None:
+        print("No NDEF message found on tag.", file=sys.stderr)
+        return 1
+    print(format_records(records))
+    print(f"({stats['apdus']} APDUs)", file=sys.stderr)
+    return 0
+
+
+def encode_text(text, compact=False) -> bytes:
+    """TLV image for TEXT: a TextRecord, or a compact record of its fields."""
+    from batch import details_fields
+    from ntag import create_compact_record, create_ndef_record
+
+    if compact:
+        return create_compact_record(details_fields(text), "dictionary")
+    return create_ndef_record(text)
+
+
+def cmd_write(args):
+    from ntag import CapacityError, write_ndef_message
+    from session import sessions
+
+    access = load_access()
+    try:
+        ndef_message = encode_text(args.text, args.compact)
+    except CapacityError as e:
+        print(e, file=sys.stderr)
+        return 1
+    reader_name = wait_for_card(args.timeout)
+    if reader_name is None:
+        print("No tag presented.", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    session = sessions.get(reader_name)
+    stats = {}
+    try:
+        uid = read_uid(session)
+        if not access.is_allowed(uid):
+            log_access(uid, "denied", started)
+            print("Wrong NFC tag! Access Denied.", file=sys.stderr)
+            return 1
+        result = "error"
+        try:
+            written = write_ndef_message(session, ndef_message, stats, diff=args.diff, verify=args.verify)
+            result = "written" if written else "failed"
+        finally:
+            log_access(uid, result, started, ndef_message, stats)
+    except tag_errors() as e:
+        print(e, file=sys.stderr)
+        return 1
+    if not written:
+        print("Failed to write to NFC tag.", file=sys.stderr)
+        return 1
+    print(f"Data written successfully! ({stats['apdus']} APDUs)")
+    return 0
+
+
+def cmd_verify(args):
+    from ntag import CapacityError, verify_ndef_digest
+    from session import sessions
+
+    try:
+        ndef_message = encode_text(args.text, args.compact)
+    except CapacityError as e:
+        print(e, file=sys.stderr)
+        return 1
+    reader_name = wait_for_card(args.timeout)
+    if reader_name is None:
+        print("No tag presented.", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    session = sessions.get(reader_name)
+    stats = {}
+    try:
+        uid = read_uid(session)  # For the audit record
+        verified = verify_ndef_digest(session, ndef_message, stats)
+    except tag_errors() as e:
+        print(e, file=sys.stderr)
+        return 1
+    log_access(uid, "verified" if verified else "not_verified", started, ndef_message, stats)
+    if not verified:
+        print(f"Tag does not hold this data. ({stats['apdus']} APDUs)")
+        return 1
+    print(f"Tag verified. ({stats['apdus']} APDUs)")
+    return 0
+
+
+def cmd_batch(args):
+    from smartcard.CardMonitoring import CardMonitor, CardObserver
+    from smartcard.System import readers
+
+    from batch import BatchJob
+    from dispatcher import ReaderDispatcher
+    from presence import ReaderPresence
+    from recent import recent_tags
+    from session import sessions
+
+    access = load_access()
+    try:
+        batch = BatchJob.from_file(args.jobfile, compact=args.compact)
+    except (OSError, ValueError) as e:
+        print(f"Cannot load {args.jobfile}: {e}", file=sys.stderr)
+        return 1
+    finished = threading.Event()
+    print(f"Batch loaded: {batch.remaining()} tags to write.", flush=True)
+    if not batch.remaining():
+        return 0  # Nothing left; waiting for taps would never finish
+
+    def handle_card(reader_name, card):
+        started = time.perf_counter()
+        session = sessions.get(reader_name)
+        uid = read_uid(session)
+        if not access.is_allowed(uid):
+            log_access(uid, "denied", started)
+            return "Wrong NFC tag! Access Denied."
+        if recent_tags.seen(uid):
+            return None  # Same tag bouncing in the field; it already got its row
+        written, message = batch.write_next(session, uid.hex().upper(), diff=args.diff)
+        if written:
+            recent_tags.remember(uid)
+        return message
+
+    def on_event(event):
+        print(f"{event.reader}: {event.message} [{event.elapsed * 1000:.0f} ms]", flush=True)
+        if not batch.remaining():
+            finished.set()
+
+    dispatcher = ReaderDispatcher(handle_card, on_event, readers())
+    reader_presence = ReaderPresence(dispatcher.readers_changed)
+    reader_presence.start()
+
+    class BatchObserver(CardObserver):
+        def update(self, observable, actions):
+            for card in actions[0]:
+                dispatcher.submit(card.reader, card)
+
+    monitor = CardMonitor()
+    observer = BatchObserver()
+    monitor.addObserver(observer)
+    try:
+        finished.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.deleteObserver(observer)
+        reader_presence.stop()
+        dispatcher.stop()
+    print(f"Done: {batch.done} written, {batch.failed} failed, {batch.remaining()} left.")
+    return 0 if not batch.remaining() else 1
+
+
+def cmd_import_patients(args):
+    from batch import load_rows
+    from patients import patients
+
+    if not patients.path:
+        print("Set NFC_PATIENTS_DB to the database file first.", file=sys.stderr)
+        return 1
+    count = patients.import_rows(load_rows(args.file))
+    print(f"Imported {count} patient records into {patients.path}.")
+    return 0
+
+
+def cmd_broker(args):
+    import broker
+
+    address = broker.SOCKET_PATH if hasattr(broker.socket, "AF_UNIX") else f"127.0.0.1:{broker.PORT}"
+    print(f"Reader broker listening on {address}", flush=True)
+    try:
+        broker.serve(broker.Broker(load_access()))
+    except broker.BrokerError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_audit(args):
+    from audit import audit
+
+    if not audit.path or not os.path.exists(audit.path):
+        print("No audit log found.", file=sys.stderr)
+        return 1
+    for entry in audit.query(args.uid, args.since, args.until, args.limit):
+        print(json.dumps(entry))
+    return 0
+
+
+def measure_startup(modules=HEADLESS_MODULES):
+    """Imports ``modules`` in a fresh interpreter under ``-X importtime``.
+
+    Returns ``(total_ms, heaviest, gui_loaded)``: ``heaviest`` lists the
+    top-level imports by cumulative time and ``gui_loaded`` names any GUI
+    toolkit that got pulled in.
+    """
+    code = "import " + ", ".join(modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    top_level = []
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        loaded.add(name.strip().split(".")[0])
+        # Nested imports are indented under the module that pulled them in.
+        if not name[1:].startswith(" "):
+            top_level.append((name.strip(), int(cumulative) / 1000))
+    total_ms = sum(ms for _, ms in top_level)
+    heaviest = sorted(top_level, key=lambda item: item[1], reverse=True)
+    return total_ms, heaviest, loaded & set(GUI_MODULES)
+
+
+def cmd_startup(args):
+    try:
+        total_ms, heaviest, gui_loaded = measure_startup()
+    except RuntimeError as e:
+        print(f"Headless import failed: {e}", file=sys.stderr)
+        return 2
+    within_budget = total_ms <= args.budget_ms and not gui_loaded
+    print(f"Headless import time: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, ms in heaviest[:10]:
+        print(f"  {ms:8.1f} ms  {name}")
+    if gui_loaded:
+        print(f"GUI modules imported on the headless path: {', '.join(sorted(gui_loaded))}")
+    if args.json:
+        report = {
+            "python": sys.version.split()[0],
+            "total_ms": round(total_ms, 2),
+            "budget_ms": args.budget_ms,
+            "within_budget": within_budget,
+            "gui_modules": sorted(gui_loaded),
+            "modules": {name: round(ms, 2) for name, ms in heaviest},
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if within_budget else 1
+
+
+def cmd_gui(args):
+    import nfc_code  # Pulls in wx only now that the windowed mode was asked for
+
+    nfc_code.run_app()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="nfc_cli", description="Headless NFC tag tool.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    uid = commands.add_parser("uid", help="print the UID of the next tag")
+    uid.add_argument("--watch", action="store_true", help="keep printing UIDs as tags arrive")
+    uid.set_defaults(func=cmd_uid)
+
+    read = commands.add_parser("read", help="print the NDEF records on the next tag")
+    read.set_defaults(func=cmd_read)
+
+    write = commands.add_parser("write", help="write a text record to the next tag")
+    write.add_argument("text")
+    write.add_argument("--diff", action="store_true", help="only rewrite pages that changed")
+    write.add_argument("--verify", action="store_true", help="also store a digest for later verification")
+    write.add_argument("--compact", action="store_true",
+                       help="write a compact record (\"Label: value\" lines become fields)")
+    write.set_defaults(func=cmd_write)
+
+    verify = commands.add_parser("verify", help="check a tag's stored digest against TEXT")
+    verify.add_argument("text")
+    verify.add_argument("--compact", action="store_true", help="TEXT was written with write --compact")
+    verify.set_defaults(func=cmd_verify)
+
+    batch = commands.add_parser("batch", help="provision tags from a CSV/JSONL job file")
+    batch.add_argument("jobfile")
+    batch.add_argument("--diff", action="store_true", help="only rewrite pages that changed")
+    batch.add_argument("--compact", action="store_true", help="write compact records instead of text")
+    batch.set_defaults(func=cmd_batch)
+
+    import_patients = commands.add_parser("import-patients", help="load patient/device records from CSV/JSONL")
+    import_patients.add_argument("file")
+    import_patients.set_defaults(func=cmd_import_patients)
+
+    serve = commands.add_parser("broker", help="share the readers with other processes over a local socket")
+    serve.set_defaults(func=cmd_broker)
+
+    audit = commands.add_parser("audit", help="print audit log records as JSON lines, newest first")
+    audit.add_argument("--uid", help="only this tag UID (hex)")
+    audit.add_argument("--since", type=float, help="Unix time of the oldest record")
+    audit.add_argument("--until", type=float, help="Unix time after the newest record")
+    audit.add_argument("--limit", type=int, default=1000)
+    audit.set_defaults(func=cmd_audit)
+
+    startup = commands.add_parser("startup", help="measure headless import time against the budget")
+    startup.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    startup.add_argument("--json", help="also write the measurement to this file")
+    startup.set_defaults(func=cmd_startup)
+
+    gui = commands.add_parser("gui", help="start the windowed application")
+    gui.set_defaults(func=cmd_gui)
+
+    for command in (uid, read, write, verify):
+        command.add_argument("--timeout", type=float, default=None, help="seconds to wait for a tag")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,20 @@
 import wx
 import threading
 import time
-from smartcard.System import readers
-from smartcard.util import toHexString
-import ndef
-from smartcard.CardConnection import CardConnection
-from smartcard.CardMonitoring import CardMonitor, CardObserver
-import os
-import hashlib
-import tkinter as tk
-from tkinter import Text, Label, Button
-from dotenv import load_dotenv
+from smartcard.CardMonitoring import CardMonitor
 
+from presence import CardPresence, ReaderPresence
+from session import sessions
+from batch import BatchJob, format_details
+from tag_observer import NTAG215Observer, load_access
+from ui_bus import UIBus
+from patients import patients
+from recent import RecentTags
+from ntag import format_records
 
 
-#  Set the correct UID in uppercase format
-EXPECTED_UID = "1DD94F118D0000"
+#  Allow/deny lists; loaded on startup, not on import, since a bad list exits
+access = None
  #---------------------- Main Page (NFC Scan) ----------------------
 class MainPage(wx.Frame):
     def __init__(self, parent, *args, **kw):
@@ -44,51 +43,94 @@ class MainPage(wx.Frame):
         self.SetSize((400, 200))
         self.Centre()
 
+        #  Cards seen recently, so one resting on the reader is reported once
+        self.recent = RecentTags()
+
+        #  Status text from the scanning thread, merged and rate limited
+        self.ui = UIBus()
+
+        #  Card arrival on the current reader; read_nfc blocks on it
+        self.card_presence = None
+
+        #  Reader attach/detach events set this instead of polling readers()
+        self.reader_ready = threading.Event()
+        self.reader_presence = ReaderPresence(self.on_readers_changed)
+        self.reader_presence.start()
+
         #  Start NFC reading in a background thread
         self.nfc_thread = threading.Thread(target=self.read_nfc, daemon=True)
         self.nfc_thread.start()
 
+    def on_readers_changed(self, added, removed):
+        """Called from the presence thread when readers come or go."""
+        if self.reader_presence.is_connected():
+            self.reader_ready.set()
+        else:
+            self.reader_ready.clear()
+            self.ui.post("message", self.show_message, " Device Not Found")
+        for reader_name in removed:
+            sessions.close(reader_name)
+        if self.card_presence is not None and self.card_presence.reader_name in removed:
+            self.card_presence.cancel()
+
     def read_nfc(self):
         """Continuously checks for NFC reader and tag."""
+        new_card = False
         while True:
+            self.reader_ready.wait()  # Sleeps until a reader is attached
             try:
-                r = readers()
+                r = self.reader_presence.readers
                 if not r:
-                    wx.CallAfter(self.show_message, " Device Not Found")
+                    continue
                 else:
-                    connection = r[0].createConnection()
-                    connection.connect()
+                    if self.card_presence is None or self.card_presence.reader_name != r[0]:
+                        if self.card_presence is not None:
+                            self.card_presence.close()  # Releases its PC/SC context
+                        self.card_presence = CardPresence(r[0])
+                    #  Blocks until a tag is placed; no fixed polling interval
+                    if not self.card_presence.wait(new_card=new_card):
+                        continue
+                    new_card = True
+                    session = sessions.get(r[0])
 
                     get_uid_command = [0xFF, 0xCA, 0x00, 0x00, 0x00]
 
-                    response, sw1, sw2 = connection.transmit(get_uid_command)
+                    response, sw1, sw2 = session.transmit(get_uid_command)
                     if sw1 == 0x90 and sw2 == 0x00:
                         uid = ''.join(f"{x:02X}" for x in response)
+                        repeat = self.recent.seen(response)
+                        self.recent.remember(response)
+                        if repeat:
+                            # Same card put back straight away; it was already reported
+                            continue
                         print(f" Detected UID: {uid}")
 
-                        if uid == EXPECTED_UID:
+                        if access.is_allowed(bytes(response)):
                             wx.CallAfter(self.show_success)
                             break  # Stop scanning once the correct tag is found
                         else:
-                            wx.CallAfter(self.show_message, " Incorrect NFC tag. Try again.")
+                            self.ui.post("message", self.show_message, " Incorrect NFC tag. Try again.")
 
                     else:
-                        wx.CallAfter(self.show_message, "Unable to read tag.")
+                        self.ui.post("message", self.show_message, "Unable to read tag.")
             
             except Exception as e:
                 print(f" Error: {e}")
-                wx.CallAfter(self.show_message, "Device Not Found")
-
-            time.sleep(1)  # Delay to prevent high CPU usage
+                self.ui.post("message", self.show_message, "Device Not Found")
+                time.sleep(1)  # Do not spin while the reader is failing
 
     def show_message(self, message):
         """Updates the label with a message."""
+        if self.label.GetLabel() == message:
+            return  # Nothing changed; skip the relayout
         self.label.SetLabel(message)
         self.Layout()  # Refresh UI to reflect changes
 
     def show_success(self):
         """Shows success message and opens the login page."""
         wx.MessageBox("Device Connected Successfully!", "Success", wx.OK | wx.ICON_INFORMATION)
+        self.reader_presence.stop()
+        self.card_presence.close()
         self.Close()
         LoginFrame(None, title="Login").Show()  # Show login page
 
@@ -132,6 +174,7 @@ class LoginFrame(wx.Frame):
             wx.MessageBox('Login Successful!', 'Info', wx.OK | wx.ICON_INFORMATION)
             self.Close()
             details = DetailsFrame(None)
+            details.operator = username
             details.Show()
         else:
             wx.MessageBox('Invalid credentials!', 'Error', wx.OK | wx.ICON_ERROR)
@@ -141,6 +184,7 @@ class LoginFrame(wx.Frame):
 class DetailsFrame(wx.Frame):
     def __init__(self, *args, **kw):
         super(DetailsFrame, self).__init__(*args, **kw)
+        self.operator = ""
         self.InitUI()
 
     def InitUI(self):
@@ -169,20 +213,32 @@ class DetailsFrame(wx.Frame):
         submit_btn = wx.Button(panel, label="SUBMIT", pos=(150, 170))
         submit_btn.Bind(wx.EVT_BUTTON, self.OnSubmit)
 
+        # Fill ZIP Code and Device ID from the local patient records
+        self.patient_id_txt.Bind(wx.EVT_TEXT, self.OnPatientID)
+
         self.SetSize((400, 250))
         self.Centre()
 
+    def OnPatientID(self, event):
+        record = patients.lookup(self.patient_id_txt.GetValue())
+        if record is not None:
+            self.zip_code_txt.ChangeValue(record.zip_code)
+            self.device_id_txt.ChangeValue(record.device_id)
+
     def OnSubmit(self, event):
         patient_id = self.patient_id_txt.GetValue()
         zip_code = self.zip_code_txt.GetValue()
         device_id = self.device_id_txt.GetValue()
 
-        if patient_id and zip_code and device_id:
+        error = patients.validate(patient_id, zip_code, device_id)
+        if error is None:
             self.Close()
             nfc_write = WriteNFCFrame(None)  # ✅ Now creating NFCWriteFrame without arguments
+            nfc_write.text_ctrl.SetValue(format_details(patient_id, zip_code, device_id))
+            nfc_write.ui.set_snapshot(operator=self.operator, patient_id=patient_id, device_id=device_id)
             nfc_write.Show()
         else:
-            wx.MessageBox('Please fill all the fields!', 'Error', wx.OK | wx.ICON_ERROR)
+            wx.MessageBox(error, 'Error', wx.OK | wx.ICON_ERROR)
 
 #---------------------------- write NFC -------------------------------
 
@@ -191,9 +247,6 @@ class WriteNFCFrame(wx.Frame):
         super().__init__(parent, title="Write NFC Data", size=(400, 300))
         self.InitUI()  # Ensure this method exists
 
-
-    EXPECTED_UID = "1DD94F118D0000"
-
     def InitUI(self):
         panel = wx.Panel(self)
         vbox = wx.BoxSizer(wx.VERTICAL)
@@ -208,28 +261,6 @@ class WriteNFCFrame(wx.Frame):
 
         
 
-def create_ndef_record(data: str) -> bytes:
-    """Encodes text into an NDEF message for NFC writing."""
-    record = ndef.TextRecord(data)
-    encoded_message = b''.join(ndef.message_encoder([record]))
-    message_length = len(encoded_message)
-    initial_message = b'\x03' + message_length.to_bytes(1, 'big') + encoded_message + b'\xFE'
-    padding_length = -len(initial_message) % 4
-    return initial_message + (b'\x00' * padding_length)
-
-def write_ndef_message(connection, ndef_message: bytes) -> bool:
-    """Writes the NDEF message to the NFC tag."""
-    page = 4
-    while ndef_message:
-        block_data = ndef_message[:4]
-        ndef_message = ndef_message[4:]
-        WRITE_COMMAND = [0xFF, 0xD6, 0x00, page, 0x04] + list(block_data)
-        response, sw1, sw2 = connection.transmit(WRITE_COMMAND)
-        if sw1 != 0x90 or sw2 != 0x00:
-            return False  # Failed to write
-        page += 1
-    return True  # Success
-
 class WriteNFCFrame(wx.Frame):
     def __init__(self, parent):
         super().__init__(parent, title="NFC Writer", size=(400, 300))
@@ -257,17 +288,63 @@ class WriteNFCFrame(wx.Frame):
         vbox.Add(self.write_button, flag=wx.ALL | wx.CENTER, border=10)
         self.write_button.Bind(wx.EVT_BUTTON, self.OnWriteNFC)
 
+        # Rewrite only the pages that differ from what is on the tag
+        self.diff_checkbox = wx.CheckBox(panel, label="Only rewrite changed pages")
+        vbox.Add(self.diff_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Store a digest with the data; a tag that already matches is not rewritten
+        self.verify_checkbox = wx.CheckBox(panel, label="Verify with digest")
+        vbox.Add(self.verify_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Pack the details into a compact record; fewer pages to write
+        self.compact_checkbox = wx.CheckBox(panel, label="Compact record")
+        vbox.Add(self.compact_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Write even if this tag just got the same data a moment ago
+        self.force_checkbox = wx.CheckBox(panel, label="Force rewrite")
+        vbox.Add(self.force_checkbox, flag=wx.ALL | wx.CENTER, border=5)
+
+        # Read Button
+        self.read_button = wx.Button(panel, label="Read from NFC")
+        vbox.Add(self.read_button, flag=wx.ALL | wx.CENTER, border=10)
+        self.read_button.Bind(wx.EVT_BUTTON, self.OnReadNFC)
+        self.read_requested = False
+
+        # Batch Button
+        self.batch_button = wx.Button(panel, label="Load Job File")
+        vbox.Add(self.batch_button, flag=wx.ALL | wx.CENTER, border=10)
+        self.batch_button.Bind(wx.EVT_BUTTON, self.OnLoadBatch)
+        self.batch = None
+
         # Status Label
         self.status_label = wx.StaticText(panel, label="", style=wx.ALIGN_CENTER)
         vbox.Add(self.status_label, flag=wx.ALL | wx.CENTER, border=10)
+        self.reader_status = {}  # Last result per reader, shown together
 
         panel.SetSizer(vbox)
 
+        # Card workers never touch widgets; they read this snapshot and post updates back
+        self.ui = UIBus()
+        self.text_ctrl.Bind(wx.EVT_TEXT, self.OnFormChanged)
+        for checkbox in (self.diff_checkbox, self.verify_checkbox, self.compact_checkbox, self.force_checkbox):
+            checkbox.Bind(wx.EVT_CHECKBOX, self.OnFormChanged)
+        self.OnFormChanged(None)
+
         # Start NFC Monitoring
         self.cardmonitor = CardMonitor()
-        self.cardobserver = NTAG215Observer(self)
+        self.cardobserver = NTAG215Observer(self, access)
         self.cardmonitor.addObserver(self.cardobserver)
 
+    def OnFormChanged(self, event):
+        """Publishes the form values and mode the card workers use."""
+        self.ui.set_snapshot(text=self.text_ctrl.GetValue().strip(),
+                             diff=self.diff_checkbox.GetValue(),
+                             verify=self.verify_checkbox.GetValue(),
+                             compact=self.compact_checkbox.GetValue(),
+                             force=self.force_checkbox.GetValue(),
+                             read_requested=self.read_requested,
+                             batch=self.batch)
+
     def OnWriteNFC(self, event):
         """Triggered when 'Write to NFC' button is clicked."""
         data = self.text_ctrl.GetValue().strip()
@@ -275,60 +352,59 @@ class WriteNFCFrame(wx.Frame):
             self.status_label.SetLabel("Please enter text to write.")
             return
 
+        self.read_requested = False
+        self.OnFormChanged(None)
         self.status_label.SetLabel("Waiting for NFC tag...")  # Waiting for tag detection
 
-    def update_status(self, status):
-        """Update the status label with a message."""
-        self.status_label.SetLabel(status)
-
+    def OnReadNFC(self, event):
+        """Triggered when 'Read from NFC' button is clicked."""
+        self.read_requested = True
+        self.OnFormChanged(None)
+        self.status_label.SetLabel("Waiting for NFC tag to read...")
+
+    def OnLoadBatch(self, event):
+        """Loads a CSV/JSONL job file; each following tag gets the next row."""
+        with wx.FileDialog(self, "Open job file", wildcard="Job files (*.csv;*.jsonl;*.nfcimg)|*.csv;*.jsonl;*.nfcimg",
+                           style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dialog:
+            if dialog.ShowModal() != wx.ID_OK:
+                return
+            path = dialog.GetPath()
+        try:
+            self.batch = BatchJob.from_file(path, compact=self.compact_checkbox.GetValue())
+            self.batch.operator = self.ui.snapshot().get("operator", "")
+        except (OSError, ValueError) as e:
+            self.status_label.SetLabel(f"Could not load job file: {e}")
+            return
+        self.read_requested = False
+        self.OnFormChanged(None)
+        self.status_label.SetLabel(f"Batch loaded: {self.batch.remaining()} tags to write.")
 
-class NTAG215Observer(CardObserver):
-    def __init__(self, app):
-        self.app = app
+    def show_records(self, records):
+        """Puts the records read from a tag into the text box."""
+        self.read_requested = False
+        self.OnFormChanged(None)
+        self.text_ctrl.SetValue(format_records(records))
+        self.status_label.SetLabel(f"Read {len(records)} record(s) from tag.")
 
-    def update(self, observable, actions):
-        """Handles the NFC card detection and writing process."""
-        addedcards, _ = actions
-        for card in addedcards:
-            try:
-                connection = card.createConnection()
-                connection.connect()
-
-                # Read NFC tag UID
-                uid_command = [0xFF, 0xCA, 0x00, 0x00, 0x00]
-                response, sw1, sw2 = connection.transmit(uid_command)
-                tag_uid = toHexString(response).replace(" ", "").upper()
-
-                if tag_uid != EXPECTED_UID:
-                    self.app.update_status("Wrong NFC tag! Access Denied.")
-                    return
-
-                # Get text from the text box
-                data = self.app.text_ctrl.GetValue().strip()
-                if not data:
-                    self.app.update_status("No text entered. Please enter text.")
-                    return
-
-                # Convert text to NDEF message
-                ndef_message = create_ndef_record(data)
-
-                # Write to NFC tag
-                if write_ndef_message(connection, ndef_message):
-                    self.app.update_status("Data written successfully!")
-                else:
-                    self.app.update_status("Failed to write to NFC tag.")
+    def update_status(self, status):
+        """Update the status label with a message."""
+        if self.status_label.GetLabel() != status:
+            self.status_label.SetLabel(status)
 
-            except Exception as e:
-                self.app.update_status(f"Error: {e}")
+    def update_reader_status(self, reader, message):
+        """Shows the latest result of every reader, one line each."""
+        self.reader_status[reader] = message
+        self.update_status("\n".join(f"{name}: {text}" for name, text in self.reader_status.items()))
 
-def main():
-    root = tk.Tk()
-    app = NFCApp(root)
-    root.mainloop()
 
-if __name__ == "__main__":
+def run_app():
+    global access
+    access = load_access()
     app = wx.App(False)  # Create the app
     frame = MainPage(None, title="NFC Scanner")  # Start with the MainPage
     frame.Show()
     app.MainLoop()  # Run the event loop
- 
\ No newline at end of file
+
+if __name__ == "__main__":
+    run_app()
+ 
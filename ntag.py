@@ -0,0 +1,585 @@
+"""NTAG21x tag access over PC/SC, shared by the NFC tool front ends."""
+import collections
+import hashlib
+import zlib
+
+import ndef
+
+
+PAGE_SIZE = 4
+CC_PAGE = 3
+USER_START_PAGE = 4
+
+CC_MAGIC = 0xE1
+
+TagInfo = collections.namedtuple("TagInfo", "name user_bytes end_page")
+
+# NTAG21x keyed by Capability Container byte 2 (NDEF area size / 8).
+# ``end_page`` is the first page past the user area.
+TAG_TYPES = {
+    0x12: TagInfo("NTAG213", 144, 40),
+    0x3E: TagInfo("NTAG215", 496, 130),
+    0x6D: TagInfo("NTAG216", 872, 226),
+}
+DEFAULT_TAG = TAG_TYPES[0x3E]
+
+# Verify mode keeps a truncated SHA-256 of the TLV image in the last pages
+# of user memory. On NTAG215/216 these sit past the CC's NDEF area; on
+# NTAG213 they are the last two NDEF pages, so a verified image must end
+# before them. A verified write clears them before touching the image, so
+# a half-finished write never verifies.
+DIGEST_SIZE = 8
+DIGEST_PAGES = DIGEST_SIZE // 4
+BLANK_DIGEST = bytes(DIGEST_SIZE)
+
+NDEF_TLV = 0x03
+NULL_TLV = 0x00
+TERMINATOR_TLV = 0xFE
+
+# Header page of an empty NDEF TLV; marks a tag whose write is in progress.
+EMPTY_NDEF_PAGE = bytes([NDEF_TLV, 0x00, TERMINATOR_TLV, 0x00])
+
+GET_UID_COMMAND = [0xFF, 0xCA, 0x00, 0x00, 0x00]
+
+# Pseudo-APDU the reader forwards to the tag as a raw frame
+# (PN53x InCommunicateThru behind the PC/SC escape).
+DIRECT_TRANSMIT = [0xFF, 0x00, 0x00, 0x00]
+COMMUNICATE_THRU = [0xD4, 0x42]
+COMMUNICATE_THRU_OK = [0xD5, 0x43, 0x00]
+
+FAST_READ = 0x3A
+FAST_WRITE = 0xA6
+GET_VERSION = 0x60
+
+# Only the NTAG I2C family implements FAST_WRITE: GET_VERSION vendor,
+# product type and subtype bytes, and the CC NDEF sizes (1k, 2k) it uses.
+NTAG_I2C_VERSION = bytes([0x04, 0x04, 0x05])
+NTAG_I2C_CC_SIZES = (0x6D, 0xEA)
+
+# Pages per FAST_READ frame, kept under the PN53x 252-byte frame limit.
+FAST_READ_PAGES = 60
+# READ BINARY always returns four pages.
+READ_BINARY_PAGES = 4
+
+# Largest run of pages sent in one multi-page command.
+MULTI_PAGE_COUNT = 4
+
+# Write strategies, fastest first. FAST_WRITE is picked from GET_VERSION
+# before writing, since a tag that NAKs it drops to IDLE and fails whatever
+# follows in the same tap.
+WRITE_MODES = ("fast_write", "multi_block", "page")
+# Status words of a reader that does not implement a command at all; only
+# these give up multi-page UPDATE BINARY, other failures may be transient.
+UNSUPPORTED_SW = ((0x67, 0x00), (0x6A, 0x81))
+READ_MODES = ("fast_read", "read_binary")
+
+# Compact external-type record for structured fields, see create_compact_record().
+COMPACT_RECORD_TYPE = "urn:nfc:ext:nfctool:d"
+# Field ids are the 1-based positions; the label is used when displaying.
+COMPACT_FIELDS = (
+    ("patient_id", "Patient ID"),
+    ("zip_code", "ZIP Code"),
+    ("device_id", "Device ID"),
+    ("text", None),
+)
+COMPACT_VERSION = 1
+COMPRESSION_MODES = (None, "zlib", "dictionary")
+# Preset deflate dictionary for "dictionary" compression: strings likely to
+# occur in free text, so even short notes shrink.
+COMPRESSION_DICTIONARY = (b"Patient ID: ZIP Code: Device ID: device patient serial model firmware "
+                          b"installed replaced battery sensor the and for with of to on in at")
+
+# Field value kinds, in the low bit of a field key.
+_KIND_TEXT = 0
+_KIND_NUMBER = 1
+
+
+class CapacityError(ValueError):
+    """Raised when an NDEF image does not fit on the tag."""
+
+
+def wrap_ndef_tlv(encoded_message: bytes) -> bytes:
+    """Frames an encoded NDEF message as a page-padded TLV image.
+
+    Messages of 255 bytes or more use the 3-byte ``FF xx xx`` length form.
+    """
+    message_length = len(encoded_message)
+    if message_length < 0xFF:
+        header = bytes([NDEF_TLV, message_length])
+    elif message_length < 0xFFFF:
+        header = bytes([NDEF_TLV, 0xFF]) + message_length.to_bytes(2, 'big')
+    else:
+        raise CapacityError(f"NDEF message of {message_length} bytes is too long for a TLV.")
+    initial_message = header + encoded_message + b'\xFE'
+    padding_length = -len(initial_message) % 4
+    return initial_message + (b'\x00' * padding_length)
+
+
+def create_ndef_record(data: str) -> bytes:
+    """Encodes text into an NDEF message for NFC writing."""
+    record = ndef.TextRecord(data)
+    encoded_message = b''.join(ndef.message_encoder([record]))
+    return wrap_ndef_tlv(encoded_message)
+
+
+def encode_varint(value: int) -> bytes:
+    """Unsigned LEB128."""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data, offset=0):
+    """Returns ``(value, next_offset)`` for the varint at ``offset``."""
+    value = shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("Truncated varint.")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _compressor(mode):
+    if mode == "dictionary":
+        return zlib.compressobj(9, zlib.DEFLATED, -15, zdict=COMPRESSION_DICTIONARY)
+    return zlib.compressobj(9, zlib.DEFLATED, -15)
+
+
+def _decompressor(mode):
+    if mode == "dictionary":
+        return zlib.decompressobj(-15, zdict=COMPRESSION_DICTIONARY)
+    return zlib.decompressobj(-15)
+
+
+def encode_compact_fields(fields, compression=None) -> bytes:
+    """Packs ``fields`` (a dict keyed by COMPACT_FIELDS names) as a compact payload.
+
+    The payload is a version byte, a compression byte, then one entry per
+    field: varint ``field_id << 1 | kind`` followed by either a varint
+    number (digit strings without a leading zero) or a varint length and
+    UTF-8 text. With ``compression`` ("zlib" or "dictionary") the entries
+    are raw-deflated, but only if that makes them smaller.
+    """
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown compression {compression!r}.")
+    body = bytearray()
+    for field_id, (name, _) in enumerate(COMPACT_FIELDS, 1):
+        value = fields.get(name)
+        if not value:
+            continue
+        value = str(value)
+        if value.isascii() and value.isdigit() and (value == "0" or value[0] != "0") and len(value) < 19:
+            body += encode_varint(field_id << 1 | _KIND_NUMBER) + encode_varint(int(value))
+        else:
+            text = value.encode("utf-8")
+            body += encode_varint(field_id << 1 | _KIND_TEXT) + encode_varint(len(text)) + text
+    mode = 0
+    if compression:
+        compressor = _compressor(compression)
+        packed = compressor.compress(bytes(body)) + compressor.flush()
+        if len(packed) < len(body):
+            body, mode = packed, COMPRESSION_MODES.index(compression)
+    return bytes([COMPACT_VERSION, mode]) + bytes(body)
+
+
+def decode_compact_fields(payload) -> dict:
+    """Inverse of encode_compact_fields(); unknown field ids are skipped."""
+    payload = bytes(payload)
+    if len(payload) < 2 or payload[0] != COMPACT_VERSION or payload[1] >= len(COMPRESSION_MODES):
+        raise ValueError("Not a compact record payload.")
+    body = payload[2:]
+    if payload[1]:
+        body = _decompressor(COMPRESSION_MODES[payload[1]]).decompress(body)
+    fields = {}
+    offset = 0
+    while offset < len(body):
+        key, offset = decode_varint(body, offset)
+        field_id, kind = key >> 1, key & 1
+        if kind == _KIND_NUMBER:
+            value, offset = decode_varint(body, offset)
+            value = str(value)
+        else:
+            length, offset = decode_varint(body, offset)
+            value = body[offset:offset + length].decode("utf-8")
+            offset += length
+        if 1 <= field_id <= len(COMPACT_FIELDS):
+            fields[COMPACT_FIELDS[field_id - 1][0]] = value
+    return fields
+
+
+def create_compact_record(fields, compression=None) -> bytes:
+    """Encodes ``fields`` as one compact external-type record, as a TLV image.
+
+    Smaller than the same fields as a TextRecord, so fewer pages are
+    written and more fits on an NTAG213.
+    """
+    record = ndef.Record(COMPACT_RECORD_TYPE, "", encode_compact_fields(fields, compression))
+    return wrap_ndef_tlv(b''.join(ndef.message_encoder([record])))
+
+
+def tag_info_from_cc(cc):
+    """Identifies the tag from its 4-byte Capability Container, or None."""
+    if len(cc) < 4 or cc[0] != CC_MAGIC:
+        return None
+    info = TAG_TYPES.get(cc[2])
+    if info is None:
+        # Some other Type 2 tag: trust the size the CC advertises.
+        info = TagInfo("Type 2 tag", cc[2] * 8, USER_START_PAGE + cc[2] * 2)
+    return info
+
+
+def check_capacity(ndef_message: bytes, tag_info, verify=False):
+    """Raises CapacityError if the TLV image is larger than the tag's NDEF area
+    (less the digest pages when ``verify`` is set)."""
+    capacity = tag_info.user_bytes
+    if verify:
+        capacity = min(capacity, (digest_page(tag_info) - USER_START_PAGE) * PAGE_SIZE)
+    if len(ndef_message) > capacity:
+        raise CapacityError(
+            f"NDEF data is {len(ndef_message)} bytes but {tag_info.name} holds {capacity}.")
+
+
+def image_digest(ndef_message) -> bytes:
+    """Short SHA-256 digest of a TLV image, as stored by verify mode."""
+    return hashlib.sha256(ndef_message).digest()[:DIGEST_SIZE]
+
+
+def digest_page(tag_info) -> int:
+    """First page of the verify digest on this tag type."""
+    return tag_info.end_page - DIGEST_PAGES
+
+
+def direct_transmit(connection, frame):
+    """Sends a raw tag frame through the reader's direct-transmit pseudo-APDU."""
+    payload = COMMUNICATE_THRU + list(frame)
+    response, sw1, sw2 = connection.transmit(DIRECT_TRANSMIT + [len(payload)] + payload)
+    if sw1 != 0x90 or sw2 != 0x00 or list(response[:3]) != COMMUNICATE_THRU_OK:
+        return None
+    return response[3:]
+
+
+def choose_write_mode(connection, tag_info=None):
+    """Picks the write mode for the tag on ``connection`` before anything is written.
+
+    Returns ``(mode, apdus)``. GET_VERSION is only sent to tags whose CC
+    size an NTAG I2C shares, so NTAG213/215 pay nothing.
+    """
+    if tag_info is None or tag_info.user_bytes // 8 not in NTAG_I2C_CC_SIZES:
+        return "multi_block", 0
+    version = direct_transmit(connection, [GET_VERSION])
+    if version is not None and bytes(version[1:4]) == NTAG_I2C_VERSION:
+        return "fast_write", 1
+    return "multi_block", 1
+
+
+class PageWriter:
+    """Writes runs of pages with the fastest command the tag takes.
+
+    Without ``mode`` the writer starts from the connection's ``write_mode``
+    (see ReaderSession, which forgets it when the tag changes), or else
+    chooses one with choose_write_mode() and stores it there. Only a
+    definitive refusal (UNSUPPORTED_SW) of multi-page UPDATE BINARY drops
+    to per-page writes. ``next_page`` is the page after the last one the
+    tag acknowledged.
+    """
+
+    def __init__(self, connection, mode=None, tag_info=None):
+        self.connection = connection
+        self.mode = mode or getattr(connection, "write_mode", None)
+        self.tag_info = tag_info
+        self.apdus = 0
+        self.next_page = None
+
+    def write(self, page: int, data) -> bool:
+        """Writes ``data`` to consecutive pages starting at ``page``."""
+        data = memoryview(data)
+        if len(data) % PAGE_SIZE:
+            data = memoryview(bytes(data) + b'\x00' * (-len(data) % PAGE_SIZE))
+        if self.mode is None:
+            self.mode, apdus = choose_write_mode(self.connection, self.tag_info)
+            self.apdus += apdus
+            self._remember_mode()
+
+        offset = 0
+        while offset < len(data):
+            chunk = data[offset:offset + MULTI_PAGE_COUNT * PAGE_SIZE]
+            if len(chunk) == PAGE_SIZE or self.mode == "page":
+                chunk = chunk[:PAGE_SIZE]
+                if not self._write_page(page, chunk):
+                    return False
+            else:
+                sw = self._write_pages(page, chunk)
+                if self.mode == "multi_block" and sw in UNSUPPORTED_SW:
+                    # The reader does not do multi-page UPDATE BINARY; retry
+                    # this chunk a page at a time.
+                    self.mode = "page"
+                    self._remember_mode()
+                    continue
+                if sw != (0x90, 0x00):
+                    return False
+            page += len(chunk) // PAGE_SIZE
+            offset += len(chunk)
+            self.next_page = page
+        return True
+
+    def _remember_mode(self):
+        if hasattr(self.connection, "write_mode"):
+            self.connection.write_mode = self.mode
+
+    def _write_page(self, page, block):
+        self.apdus += 1
+        command = [0xFF, 0xD6, 0x00, page, PAGE_SIZE] + list(block)
+        _, sw1, sw2 = self.connection.transmit(command)
+        return sw1 == 0x90 and sw2 == 0x00
+
+    def _write_pages(self, page, chunk):
+        """Sends one multi-page command and returns its ``(sw1, sw2)``."""
+        self.apdus += 1
+        if self.mode == "fast_write":
+            last_page = page + len(chunk) // PAGE_SIZE - 1
+            if direct_transmit(self.connection, [FAST_WRITE, page, last_page] + list(chunk)) is None:
+                return 0x63, 0x00  # No ACK from the tag: a failed write, not an unsupported one
+            return 0x90, 0x00
+        command = [0xFF, 0xD6, 0x00, page, len(chunk)] + list(chunk)
+        _, sw1, sw2 = self.connection.transmit(command)
+        return sw1, sw2
+
+
+class PageReader:
+    """Reads runs of pages with FAST_READ, or 16-byte READ BINARY if refused."""
+
+    def __init__(self, connection, mode=READ_MODES[0]):
+        self.connection = connection
+        self.mode = mode
+        self.apdus = 0
+
+    def read(self, page: int, length: int):
+        """Returns at least ``length`` bytes starting at ``page``, or None."""
+        data = bytearray()
+        while len(data) < length:
+            pages = -(-(length - len(data)) // PAGE_SIZE)
+            block = self.read_block(page, pages)
+            if block is None:
+                return None
+            data += block
+            page += len(block) // PAGE_SIZE
+        return bytes(data)
+
+    def read_block(self, page: int, pages: int):
+        """Reads one command's worth of pages (at most ``pages`` when batched)."""
+        if self.mode == "fast_read":
+            pages = min(pages, FAST_READ_PAGES)
+            self.apdus += 1
+            block = direct_transmit(self.connection, [FAST_READ, page, page + pages - 1])
+            if block is not None and len(block) == pages * PAGE_SIZE:
+                return bytes(block)
+            self.mode = "read_binary"
+        self.apdus += 1
+        command = [0xFF, 0xB0, 0x00, page, READ_BINARY_PAGES * PAGE_SIZE]
+        response, sw1, sw2 = self.connection.transmit(command)
+        if sw1 != 0x90 or sw2 != 0x00 or len(response) < PAGE_SIZE:
+            return None
+        return bytes(response[:len(response) - len(response) % PAGE_SIZE])
+
+
+def changed_page_runs(current: bytes, new: bytes):
+    """Yields ``(page_offset, data)`` runs of consecutive pages that differ."""
+    run_start = None
+    for offset in range(0, len(new), PAGE_SIZE):
+        same = current[offset:offset + PAGE_SIZE] == new[offset:offset + PAGE_SIZE]
+        if not same and run_start is None:
+            run_start = offset
+        elif same and run_start is not None:
+            yield run_start // PAGE_SIZE, new[run_start:offset]
+            run_start = None
+    if run_start is not None:
+        yield run_start // PAGE_SIZE, new[run_start:]
+
+
+def read_tag_info(reader):
+    """Reads the Capability Container once and identifies the tag.
+
+    ``reader`` is a PageReader. Falls back to NTAG215 if the CC is unreadable.
+    """
+    block = reader.read_block(CC_PAGE, 1)
+    return tag_info_from_cc(block or b'') or DEFAULT_TAG
+
+
+def write_ndef_message(connection, ndef_message: bytes, stats=None, diff=False, tag_info=None,
+                       verify=False) -> bool:
+    """Writes the NDEF message to the NFC tag.
+
+    The tag type is read from the Capability Container (unless ``tag_info``
+    is given) and an oversize image raises CapacityError before any page
+    is written. Uses multi-page commands where the tag and reader take them
+    and per-page UPDATE BINARY otherwise (see PageWriter). With ``diff`` the current user memory
+    is read first and only the pages that differ are rewritten. With
+    ``verify`` the digest pages are cleared before any image page changes
+    and the image digest is written last, for verify_ndef_digest().
+    If ``stats`` is a dict it receives the number of APDUs sent
+    (``"apdus"``), the pages written (``"pages"``) and the write mode used
+    (``"mode"``).
+    """
+    reader = PageReader(connection)
+    if tag_info is None:
+        tag_info = read_tag_info(reader)
+    check_capacity(ndef_message, tag_info, verify)
+    writer = PageWriter(connection, tag_info=tag_info)
+    runs = [(0, ndef_message)]
+    if diff:
+        current = reader.read(USER_START_PAGE, len(ndef_message))
+        if current is not None:
+            runs = list(changed_page_runs(current, ndef_message))
+    if verify:
+        # check_capacity() kept the image clear of the digest pages, so the
+        # diff above never covers them.
+        digest_offset = digest_page(tag_info) - USER_START_PAGE
+        if runs:
+            # Cleared first: an interrupted write must not keep the old digest.
+            runs.insert(0, (digest_offset, BLANK_DIGEST))
+        # Written after the image, so a matching digest means the write finished.
+        runs.append((digest_offset, image_digest(ndef_message)))
+
+    success = True
+    for page_offset, data in runs:
+        if not writer.write(USER_START_PAGE + page_offset, data):
+            success = False
+            break
+    if stats is not None:
+        stats["apdus"] = reader.apdus + writer.apdus
+        stats["pages"] = sum(-(-len(data) // PAGE_SIZE) for _, data in runs)
+        stats["mode"] = writer.mode
+    return success
+
+
+def verify_ndef_digest(connection, ndef_message, stats=None, tag_info=None) -> bool:
+    """Checks the tag holds ``ndef_message`` by reading its digest pages and
+    its first block.
+
+    Unverified writes leave the digest pages alone, so the first block (TLV
+    header and start of the record) must match too; that catches a tag
+    rewritten without verify since the digest was stored. Costs two APDUs
+    plus one for the CC unless ``tag_info`` is given.
+    """
+    reader = PageReader(connection)
+    if tag_info is None:
+        tag_info = read_tag_info(reader)
+    block = reader.read_block(digest_page(tag_info), DIGEST_PAGES)
+    matches = block is not None and block[:DIGEST_SIZE] == image_digest(ndef_message)
+    if matches:
+        head = bytes(ndef_message[:READ_BINARY_PAGES * PAGE_SIZE])
+        block = reader.read_block(USER_START_PAGE, len(head) // PAGE_SIZE)
+        matches = block is not None and block[:len(head)] == head
+    if stats is not None:
+        stats["apdus"] = reader.apdus
+    return matches
+
+
+def parse_tlv(data: bytes):
+    """Finds the NDEF message in a TLV stream.
+
+    Returns ``(complete, message)``: ``complete`` is False while more bytes
+    are needed, and ``message`` is None when the stream ends without one.
+    """
+    offset = 0
+    while offset < len(data):
+        tag = data[offset]
+        if tag == NULL_TLV:
+            offset += 1
+            continue
+        if tag == TERMINATOR_TLV:
+            return True, None
+        if offset + 2 > len(data):
+            return False, None
+        length = data[offset + 1]
+        offset += 2
+        if length == 0xFF:
+            if offset + 2 > len(data):
+                return False, None
+            length = int.from_bytes(data[offset:offset + 2], 'big')
+            offset += 2
+        if tag == NDEF_TLV:
+            if offset + length > len(data):
+                return False, None
+            return True, bytes(data[offset:offset + length])
+        offset += length
+    return False, None
+
+
+def read_ndef_message(connection, stats=None):
+    """Reads the raw NDEF message from the tag, or None if there is none.
+
+    Pages are fetched in as few commands as the reader allows and reading
+    stops as soon as the NDEF TLV or the terminator has been seen. The
+    first read starts at the Capability Container, which bounds the rest.
+    """
+    return read_ndef_image(connection, stats)[1]
+
+
+def read_ndef_image(connection, stats=None):
+    """Like read_ndef_message(), but returns ``(image, message)`` where
+    ``image`` is the user memory read from the first user page on, as it
+    is laid out on the tag (Lock Control and other TLVs included)."""
+    reader = PageReader(connection)
+    data = bytearray()
+    message = None
+    end_page = DEFAULT_TAG.end_page
+    page = end_page
+    block = reader.read_block(CC_PAGE, READ_BINARY_PAGES)
+    if block is not None:
+        end_page = (tag_info_from_cc(block[:PAGE_SIZE]) or DEFAULT_TAG).end_page
+        data += block[PAGE_SIZE:]
+        page = CC_PAGE + len(block) // PAGE_SIZE
+    while True:
+        complete, message = parse_tlv(data)
+        if complete or page >= end_page:
+            break
+        # Ask for whatever the TLV header says is still missing.
+        wanted = READ_BINARY_PAGES
+        if len(data) >= 4 and data[0] == NDEF_TLV:
+            length = data[1] if data[1] != 0xFF else int.from_bytes(data[2:4], 'big')
+            header = 2 if data[1] != 0xFF else 4
+            wanted = max(wanted, -(-(header + length + 1 - len(data)) // PAGE_SIZE))
+        block = reader.read_block(page, min(wanted, end_page - page))
+        if block is None:
+            break
+        data += block
+        page += len(block) // PAGE_SIZE
+    if stats is not None:
+        stats["apdus"] = reader.apdus
+        stats["bytes"] = len(data)
+    return bytes(data), message
+
+
+def read_ndef_records(connection, stats=None):
+    """Reads and decodes the NDEF records on the tag, or None if unreadable."""
+    message = read_ndef_message(connection, stats)
+    if message is None:
+        return None
+    return list(ndef.message_decoder(message))
+
+
+def format_records(records) -> str:
+    """Renders decoded records as text for display."""
+    lines = []
+    for record in records:
+        if isinstance(record, ndef.TextRecord):
+            lines.append(record.text)
+        elif record.type == COMPACT_RECORD_TYPE:
+            fields = decode_compact_fields(record.data)
+            for name, label in COMPACT_FIELDS:
+                if name in fields:
+                    lines.append(f"{label}: {fields[name]}" if label else fields[name])
+        else:
+            lines.append(str(record))
+    return "\n".join(lines)
@@ -0,0 +1,118 @@
+"""Local patient/device records used to autofill and check the details form.
+
+Records live in SQLite, keyed on Patient ID with an index on Device ID, so
+lookups stay fast at millions of rows; recent lookups are also kept in a
+small LRU cache (found records only, so typing a Patient ID does not fill
+it with misses). Set ``NFC_PATIENTS_DB`` to the database file and load it
+with ``python -m nfc_cli import-patients FILE`` (CSV or JSONL with
+patient_id, zip_code and device_id columns). Without a database the form
+only checks that the fields are filled in.
+"""
+import collections
+import os
+import threading
+
+
+# Recent Patient ID lookups kept in memory.
+CACHE_SIZE = 256
+
+PatientRecord = collections.namedtuple("PatientRecord", "patient_id zip_code device_id")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    zip_code TEXT NOT NULL,
+    device_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS patients_device ON patients (device_id);
+"""
+
+
+def _text(value) -> str:
+    """A CSV/JSONL field as stripped text; JSONL numbers become strings."""
+    return "" if value is None else str(value).strip()
+
+
+class PatientStore:
+    """Patient ID -> PatientRecord lookups against a SQLite file."""
+
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and (self.db is not None or os.path.exists(self.path))
+
+    def _connect(self):
+        if self.db is None:
+            import sqlite3  # Kept off the import path when no store is configured
+
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.executescript(_SCHEMA)
+        return self.db
+
+    def lookup(self, patient_id):
+        """Returns the PatientRecord for ``patient_id``, or None."""
+        patient_id = patient_id.strip()
+        if not patient_id or not self.enabled:
+            return None
+        with self.lock:
+            record = self.cache.get(patient_id)
+            if record is not None:
+                self.cache.move_to_end(patient_id)
+            else:
+                row = self._connect().execute(
+                    "SELECT patient_id, zip_code, device_id FROM patients WHERE patient_id = ?",
+                    (patient_id,)).fetchone()
+                if row is None:
+                    return None  # Not cached: most misses are prefixes being typed
+                record = self.cache[patient_id] = PatientRecord(*row)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return record
+
+    def by_device(self, device_id):
+        """Returns the PatientRecord that holds ``device_id``, or None."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT patient_id, zip_code, device_id FROM patients WHERE device_id = ?",
+                (device_id.strip(),)).fetchone()
+        return PatientRecord(*row) if row else None
+
+    def validate(self, patient_id, zip_code, device_id):
+        """Returns an error message for the form, or None if it is fine."""
+        if not (patient_id and zip_code and device_id):
+            return "Please fill all the fields!"
+        if not self.enabled:
+            return None
+        record = self.lookup(patient_id)
+        if record is None:
+            return f"Unknown Patient ID {patient_id}."
+        if record.zip_code != zip_code.strip():
+            return f"ZIP Code does not match Patient ID {patient_id}."
+        if record.device_id != device_id.strip():
+            return f"Device ID does not match Patient ID {patient_id}."
+        return None
+
+    def import_rows(self, rows) -> int:
+        """Adds or replaces records from dict rows; returns how many."""
+        entries = [
+            (_text(row.get("patient_id")), _text(row.get("zip_code")), _text(row.get("device_id")))
+            for row in rows
+        ]
+        entries = [entry for entry in entries if entry[0]]
+        with self.lock:
+            db = self._connect()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO patients VALUES (?, ?, ?)", entries)
+            self.cache.clear()
+        return len(entries)
+
+
+patients = PatientStore(os.getenv("NFC_PATIENTS_DB"))
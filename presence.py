@@ -0,0 +1,234 @@
+"""Background reader attach/detach and card presence notifications over PC/SC."""
+import threading
+import time
+
+from smartcard import scard
+from smartcard.ReaderMonitoring import ReaderMonitor, ReaderObserver
+
+
+# Pseudo reader that changes state whenever a reader is plugged or unplugged.
+PNP_NOTIFICATION = "\\\\?PnP?\\Notification"
+
+# Fallback card polling: this fast right after activity, backing off to
+# POLL_MAX while the reader stays idle.
+POLL_MIN = 0.05
+POLL_MAX = 1.0
+
+
+class _MonitorObserver(ReaderObserver):
+    """Forwards pyscard ReaderMonitor updates to a ReaderPresence."""
+
+    def __init__(self, presence):
+        self.presence = presence
+
+    def update(self, observable, actions):
+        added, removed = actions
+        self.presence._apply([str(r) for r in added], [str(r) for r in removed])
+
+
+class ReaderPresence:
+    """Tracks attached PC/SC readers from a background thread.
+
+    The thread blocks in SCardGetStatusChange on the PnP notification reader,
+    so it costs nothing while idle and wakes as soon as a reader comes or
+    goes. Where PnP notification is not supported it falls back to pyscard's
+    ReaderMonitor. ``on_change(added, removed)`` runs on the watcher thread;
+    GUI callers must hop to the UI thread themselves (e.g. ``wx.CallAfter``).
+    """
+
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.readers = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._context = None
+        self._thread = None
+        self._monitor = None
+        self._observer = None
+
+    def start(self):
+        """Starts watching; the current readers are reported as added."""
+        hresult, self._context = scard.SCardEstablishContext(scard.SCARD_SCOPE_USER)
+        if hresult != scard.SCARD_S_SUCCESS:
+            self._context = None
+            self._start_monitor()
+            return
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching and releases the PC/SC context."""
+        self._stopped.set()
+        if self._context is not None:
+            scard.SCardCancel(self._context)
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        if self._monitor is not None:
+            self._monitor.deleteObserver(self._observer)
+            self._monitor = None
+        if self._context is not None:
+            scard.SCardReleaseContext(self._context)
+            self._context = None
+
+    def is_connected(self) -> bool:
+        """True while at least one reader is attached."""
+        with self._lock:
+            return bool(self.readers)
+
+    def _apply(self, added, removed):
+        with self._lock:
+            added = [r for r in added if r not in self.readers]
+            removed = [r for r in removed if r in self.readers]
+            self.readers = [r for r in self.readers if r not in removed] + added
+        if added or removed:
+            self.on_change(added, removed)
+
+    def _publish(self, current):
+        with self._lock:
+            removed = [r for r in self.readers if r not in current]
+        self._apply(current, removed)
+
+    def _list_readers(self):
+        hresult, names = scard.SCardListReaders(self._context, [])
+        if hresult != scard.SCARD_S_SUCCESS:
+            return []
+        return list(names)
+
+    def _watch(self):
+        self._publish(self._list_readers())
+        states = [(PNP_NOTIFICATION, scard.SCARD_STATE_UNAWARE)]
+        while not self._stopped.is_set():
+            hresult, new_states = scard.SCardGetStatusChange(self._context, scard.INFINITE, states)
+            if self._stopped.is_set() or hresult == scard.SCARD_E_CANCELLED:
+                return
+            if hresult != scard.SCARD_S_SUCCESS or new_states[0][1] & scard.SCARD_STATE_UNKNOWN:
+                # No PnP notifications from this PC/SC stack.
+                self._start_monitor()
+                return
+            states = [(name, event_state) for name, event_state, _ in new_states]
+            self._publish(self._list_readers())
+
+    def _start_monitor(self):
+        self._observer = _MonitorObserver(self)
+        self._monitor = ReaderMonitor()
+        self._monitor.addObserver(self._observer)
+
+
+def _probe_uid(reader_name):
+    """Fallback presence check: does a tag answer a UID read?"""
+    from ntag import GET_UID_COMMAND
+    from session import sessions
+
+    session = sessions.get(reader_name)
+    try:
+        _, sw1, sw2 = session.transmit(GET_UID_COMMAND)
+    except Exception:
+        session.disconnect()
+        return False
+    return sw1 == 0x90 and sw2 == 0x00
+
+
+class CardPresence:
+    """Waits for a card on one reader without fixed-interval polling.
+
+    wait() blocks in SCardGetStatusChange on the reader, so it returns
+    within milliseconds of a tap and costs nothing while idle. Where the
+    PC/SC stack cannot report card state, it polls ``probe(reader_name)``
+    instead: every POLL_MIN seconds after activity, doubling up to POLL_MAX
+    while nothing happens. A reader that is unplugged is asked again every
+    POLL_MAX seconds until it is back. cancel() wakes a blocked wait() from
+    another thread.
+    """
+
+    def __init__(self, reader_name, probe=_probe_uid):
+        self.reader_name = str(reader_name)
+        self.probe = probe
+        self.present = False
+        self.interval = POLL_MIN
+        self._state = None
+        self._context = None
+        self._polling = False
+        self._cancelled = threading.Event()
+
+    def wait(self, timeout=None, new_card=False) -> bool:
+        """Returns True once a card is on the reader, False on timeout or cancel.
+
+        With ``new_card`` a card that is already there does not count; it
+        has to be taken off and a card put back.
+        """
+        self._cancelled.clear()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if new_card:
+            # Wait for the card that is there now (if any) to leave first.
+            while self._check(deadline, want=False):
+                if self._expired(deadline):
+                    return False
+        while not self._check(deadline, want=True):
+            if self._expired(deadline):
+                return False
+        return True
+
+    def cancel(self):
+        """Wakes a blocked wait(), which then returns False."""
+        self._cancelled.set()
+        if self._context is not None:
+            scard.SCardCancel(self._context)
+
+    def close(self):
+        if self._context is not None:
+            scard.SCardReleaseContext(self._context)
+            self._context = None
+
+    def _expired(self, deadline):
+        return self._cancelled.is_set() or (deadline is not None and time.monotonic() >= deadline)
+
+    def _check(self, deadline, want):
+        """Waits for at most one state change; returns whether a card is present."""
+        if not self._polling and self._context is None:
+            hresult, self._context = scard.SCardEstablishContext(scard.SCARD_SCOPE_USER)
+            if hresult != scard.SCARD_S_SUCCESS:
+                self._context = None
+                self._polling = True
+        if self._polling:
+            return self._poll(deadline, want)
+        state = scard.SCARD_STATE_UNAWARE if self._state is None else self._state
+        remaining = scard.INFINITE if deadline is None else max(0, int((deadline - time.monotonic()) * 1000))
+        if self._state is not None and self.present == want:
+            # The last known state may be stale (the card left between
+            # waits); refresh it without blocking before trusting it.
+            remaining = 0
+        hresult, states = scard.SCardGetStatusChange(self._context, remaining, [(self.reader_name, state)])
+        if hresult in (scard.SCARD_E_TIMEOUT, scard.SCARD_E_CANCELLED):
+            return self.present
+        if hresult == scard.SCARD_E_NO_SERVICE or (
+                hresult == scard.SCARD_S_SUCCESS and states[0][1] & scard.SCARD_STATE_UNKNOWN):
+            # No PC/SC service, or no card notifications from this stack.
+            self._polling = True
+            return self._poll(deadline, want)
+        if hresult != scard.SCARD_S_SUCCESS:
+            # Reader unplugged or not there yet (SCARD_E_UNKNOWN_READER and
+            # the like): start over from scratch after a pause.
+            self._state = None
+            self.present = False
+            self._cancelled.wait(self._delay(POLL_MAX, deadline))
+            return False
+        self._state = states[0][1] & ~scard.SCARD_STATE_CHANGED
+        self.present = bool(self._state & scard.SCARD_STATE_PRESENT)
+        return self.present
+
+    def _poll(self, deadline, want):
+        present = bool(self.probe(self.reader_name))
+        if present != self.present:
+            self.interval = POLL_MIN  # Something happened; stay quick for a while
+        else:
+            self.interval = min(self.interval * 2, POLL_MAX)
+        self.present = present
+        if present != want:
+            self._cancelled.wait(self._delay(self.interval, deadline))
+        return present
+
+    @staticmethod
+    def _delay(delay, deadline):
+        if deadline is not None:
+            delay = max(0, min(delay, deadline - time.monotonic()))
+        return delay
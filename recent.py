@@ -0,0 +1,59 @@
+"""Short-lived memory of tags that were just handled, to drop repeat events."""
+import collections
+import os
+import threading
+import time
+
+
+# Repeat events for the same tag and payload inside this window are dropped.
+DEBOUNCE_SECONDS = float(os.getenv("NFC_DEBOUNCE_SECONDS", "3"))
+MAX_ENTRIES = 1024
+
+
+class RecentTags:
+    """TTL cache of ``(uid, payload digest)`` pairs with LRU eviction.
+
+    A tag jittering at the edge of the field produces a burst of card
+    events; the first one does the work and the rest find their key here.
+    """
+
+    def __init__(self, ttl=DEBOUNCE_SECONDS, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def seen(self, uid, digest=None) -> bool:
+        """True if this tag/payload was handled within the last ``ttl`` seconds."""
+        key = (bytes(uid), digest)
+        now = time.monotonic()
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is None:
+                return False
+            if expires < now:
+                del self.entries[key]
+                return False
+            self.entries.move_to_end(key)
+            return True
+
+    def remember(self, uid, digest=None):
+        key = (bytes(uid), digest)
+        with self.lock:
+            self.entries[key] = time.monotonic() + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forget(self, uid=None):
+        """Drops one tag's entries, or everything."""
+        with self.lock:
+            if uid is None:
+                self.entries.clear()
+                return
+            uid = bytes(uid)
+            for key in [key for key in self.entries if key[0] == uid]:
+                del self.entries[key]
+
+
+recent_tags = RecentTags()
@@ -0,0 +1,143 @@
+"""Long-lived PC/SC connections shared across the NFC tool."""
+import threading
+
+from smartcard import scard
+from smartcard.Exceptions import CardConnectionException
+from smartcard.pcsc.PCSCReader import PCSCReader
+
+from instrumentation import classify, instrument
+
+
+class ReaderSession:
+    """One warm connection handle to one reader.
+
+    The handle is opened on first use and kept across taps. When the card is
+    swapped or reset underneath it, transmit() reconnects; only the UID read is
+    resent, anything else raises after the reconnect so a write never lands
+    on a tag whose UID nobody checked. If the
+    card is gone the handle is dropped and the error is raised.
+
+    ``write_mode`` is the page write PageWriter settled on for the tag on
+    the reader, so re-taps of that tag skip choosing it again. It is
+    forgotten whenever the handle is reopened or resynced, or a UID read
+    returns a different tag.
+    """
+
+    def __init__(self, reader_name, reader=None):
+        self.reader_name = reader_name
+        # Any object with createConnection(); defaults to the PC/SC reader.
+        self.reader = reader
+        self.connection = None
+        self.uid = None
+        self.write_mode = None
+        self.lock = threading.RLock()
+
+    def connect(self):
+        """Returns the connection, opening it if needed."""
+        with self.lock:
+            if self.connection is None:
+                reader = self.reader or PCSCReader(self.reader_name)
+                connection = reader.createConnection()
+                # Leave the card powered when the handle is released so the
+                # next tap does not pay for a cold reset.
+                connection.connect(disposition=scard.SCARD_LEAVE_CARD)
+                self.connection = instrument(connection, self.reader_name)
+                self._forget_tag()
+            return self.connection
+
+    def reconnect(self, disposition=scard.SCARD_LEAVE_CARD):
+        """Re-synchronises the handle after a card swap or reset."""
+        with self.lock:
+            if self.connection is None:
+                return self.connect()
+            self._forget_tag()
+            try:
+                self.connection.reconnect(disposition=disposition)
+            except (AttributeError, TypeError):
+                # pyscard without reconnect(): reopen the handle instead.
+                self.disconnect()
+                return self.connect()
+            except CardConnectionException:
+                self.disconnect()
+                raise
+            return self.connection
+
+    def disconnect(self):
+        """Releases the connection handle."""
+        with self.lock:
+            if self.connection is not None:
+                try:
+                    self.connection.disconnect()
+                except CardConnectionException:
+                    pass
+                self.connection = None
+
+    def transmit(self, command):
+        """Sends an APDU and returns ``(response, sw1, sw2)``."""
+        with self.lock:
+            try:
+                result = self.connect().transmit(command)
+            except CardConnectionException:
+                # Handle went stale (card swapped or reset); resync it, but only
+                # resend the UID read: a resent CC read would let the write that
+                # follows land on a tag the caller never checked.
+                self.reconnect()
+                if not is_retryable(command):
+                    raise
+                result = self.connection.transmit(command)
+            response, sw1, sw2 = result
+            if classify(command)[0] == "get_uid" and (sw1, sw2) == (0x90, 0x00) and bytes(response) != self.uid:
+                self._forget_tag()
+                self.uid = bytes(response)
+            return result
+
+    def _forget_tag(self):
+        # Write modes belong to one tag; the next write chooses again.
+        self.uid = None
+        self.write_mode = None
+
+
+def is_retryable(command) -> bool:
+    """True for APDUs that transmit() may resend after a reconnect."""
+    name, _ = classify(command)
+    return name == "get_uid"
+
+
+class SessionManager:
+    """Keeps one ReaderSession per reader name."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, reader_name) -> ReaderSession:
+        """Returns the session for ``reader_name``, creating it on first use."""
+        reader_name = str(reader_name)
+        with self.lock:
+            session = self.sessions.get(reader_name)
+            if session is None:
+                session = self.sessions[reader_name] = ReaderSession(reader_name)
+            return session
+
+    def attach(self, reader) -> ReaderSession:
+        """Binds a reader object (e.g. a simulated one) to its name."""
+        reader_name = str(reader)
+        self.close(reader_name)
+        with self.lock:
+            session = self.sessions[reader_name] = ReaderSession(reader_name, reader)
+            return session
+
+    def close(self, reader_name=None):
+        """Disconnects one reader's session, or all of them."""
+        with self.lock:
+            if reader_name is None:
+                names = list(self.sessions)
+            else:
+                names = [str(reader_name)]
+            sessions = [self.sessions.pop(name) for name in names if name in self.sessions]
+        for session in sessions:
+            session.disconnect()
+
+
+# Shared by every window so the UID check and page writes reuse one handle.
+sessions = SessionManager()
@@ -0,0 +1,228 @@
+"""In-process simulated PC/SC reader and NTAG215 / NTAG I2C cards.
+
+Speaks the same createConnection / connect / transmit interface as pyscard
+so the write path can run without hardware:
+
+    reader = SimulatedReader("Sim 0", SimulatedNTAG215())
+    sessions.attach(reader)
+    write_ndef_message(sessions.get("Sim 0"), create_ndef_record("hi"))
+
+Latency, tag removal part way through a write and error status words can be
+configured per card.
+"""
+import threading
+import time
+
+from smartcard.Exceptions import CardConnectionException, NoCardException
+
+from ntag import (COMMUNICATE_THRU, COMMUNICATE_THRU_OK, DIRECT_TRANSMIT, FAST_READ, FAST_WRITE, GET_VERSION,
+                  PAGE_SIZE)
+
+
+SW_OK = (0x90, 0x00)
+SW_WRONG_LENGTH = (0x67, 0x00)
+SW_WRONG_PARAMS = (0x6A, 0x86)
+SW_NOT_SUPPORTED = (0x6A, 0x81)
+SW_OUT_OF_RANGE = (0x6B, 0x00)
+
+# Native Type 2 commands reached through direct transmit.
+READ = 0x30
+WRITE = 0xA2
+READ_CNT = 0x39
+
+# PN53x status byte for a tag that did not answer (NAK/timeout).
+THRU_TIMEOUT = 0x01
+
+
+class SimulatedNTAG215:
+    """NTAG215 memory image plus fault-injection knobs.
+
+    ``latency`` seconds are spent on every APDU. ``remove_after`` pulls the
+    tag out of the field once that many APDUs have been handled.
+    ``errors`` maps an APDU index (0-based, counted per card) to the
+    ``(sw1, sw2)`` it should fail with. ``fast_write`` and ``multi_block``
+    choose whether those optional commands are accepted; real NTAG215s
+    refuse FAST_WRITE.
+    """
+
+    PAGES = 135
+    USER_END_PAGE = 130
+    CC_SIZE = 0x3E
+    VERSION = bytes.fromhex("0004040201001103")
+
+    def __init__(self, uid=bytes.fromhex("04A1B2C3D4E5F6"), latency=0.0, remove_after=None,
+                 errors=None, fast_write=False, multi_block=False, fast_read=True):
+        self.uid = bytes(uid)
+        self.latency = latency
+        self.remove_after = remove_after
+        self.errors = dict(errors or {})
+        self.fast_write = fast_write
+        self.multi_block = multi_block
+        self.fast_read = fast_read
+        self.apdus = 0
+        self.read_count = 0
+        self.lock = threading.Lock()
+        self.memory = bytearray(self.PAGES * PAGE_SIZE)
+        self.memory[0:3] = self.uid[0:3]
+        self.memory[4:8] = self.uid[3:7]
+        self.memory[12:16] = bytes([0xE1, 0x10, self.CC_SIZE, 0x00])  # Capability Container
+        self.memory[16:20] = bytes([0x03, 0x00, 0xFE, 0x00])  # Empty NDEF TLV
+
+    @property
+    def present(self):
+        return self.remove_after is None or self.apdus < self.remove_after
+
+    def page_data(self, page, count=1) -> bytes:
+        return bytes(self.memory[page * PAGE_SIZE:(page + count) * PAGE_SIZE])
+
+    def user_data(self) -> bytes:
+        return self.page_data(4, self.USER_END_PAGE - 4)
+
+    def process(self, apdu):
+        """Handles one APDU and returns ``(response, sw1, sw2)``."""
+        with self.lock:
+            if self.latency:
+                time.sleep(self.latency)
+            if not self.present:
+                raise CardConnectionException("Card was removed")
+            index = self.apdus
+            self.apdus += 1
+            if index in self.errors:
+                return [], *self.errors[index]
+            return self._dispatch(list(apdu))
+
+    def _dispatch(self, apdu):
+        cla, ins, p1, p2 = apdu[:4]
+        if cla != 0xFF:
+            return [], 0x6E, 0x00
+        if ins == 0xCA:
+            return list(self.uid), *SW_OK
+        if ins == 0xB0:
+            if p2 >= self.PAGES:
+                return [], *SW_OUT_OF_RANGE
+            self.read_count += 1
+            return list(self.page_data(p2, 4).ljust(16, b"\x00")), *SW_OK
+        if ins == 0xD6:
+            data = bytes(apdu[5:5 + apdu[4]])
+            if len(data) != PAGE_SIZE and not (self.multi_block and len(data) % PAGE_SIZE == 0):
+                return [], *SW_WRONG_LENGTH
+            if not self._write(p2, data):
+                return [], *SW_OUT_OF_RANGE
+            return [], *SW_OK
+        if apdu[:4] == DIRECT_TRANSMIT and apdu[5:7] == COMMUNICATE_THRU:
+            reply = self._native(apdu[7:5 + apdu[4]])
+            if reply is None:
+                return [0xD5, 0x43, THRU_TIMEOUT], *SW_OK
+            return COMMUNICATE_THRU_OK + list(reply), *SW_OK
+        return [], *SW_NOT_SUPPORTED
+
+    def _native(self, frame):
+        """Runs a raw Type 2 command; None means the tag did not answer."""
+        command = frame[0]
+        if command == READ and len(frame) == 2:
+            self.read_count += 1
+            return self.page_data(frame[1], 4)
+        if command == FAST_READ and len(frame) == 3 and self.fast_read:
+            start, end = frame[1], frame[2]
+            if end < start or end >= self.PAGES:
+                return None
+            self.read_count += 1
+            return self.page_data(start, end - start + 1)
+        if command == WRITE and len(frame) == 6:
+            return b"" if self._write(frame[1], bytes(frame[2:])) else None
+        if command == FAST_WRITE and self.fast_write and len(frame) > 3:
+            start, end, data = frame[1], frame[2], bytes(frame[3:])
+            if len(data) != (end - start + 1) * PAGE_SIZE:
+                return None
+            return b"" if self._write(start, data) else None
+        if command == GET_VERSION and len(frame) == 1:
+            return self.VERSION
+        if command == READ_CNT and len(frame) == 2 and frame[1] == 0x02:
+            return self.read_count.to_bytes(3, "little")
+        return None
+
+    def _write(self, page, data):
+        # Only the user area is writable; lock/CC/config pages are protected.
+        last_page = page + len(data) // PAGE_SIZE
+        if page < 4 or last_page > self.USER_END_PAGE:
+            return False
+        self.memory[page * PAGE_SIZE:last_page * PAGE_SIZE] = data
+        return True
+
+
+class SimulatedNTAGI2C(SimulatedNTAG215):
+    """NTAG I2C 1k: same command set plus FAST_WRITE, and a larger user area."""
+
+    PAGES = 231
+    USER_END_PAGE = 226
+    CC_SIZE = 0x6D
+    VERSION = bytes.fromhex("0004040502011303")
+
+    def __init__(self, *args, fast_write=True, **kwargs):
+        super().__init__(*args, fast_write=fast_write, **kwargs)
+
+
+class SimulatedConnection:
+    """Connection handle to a SimulatedReader."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.card = None
+
+    def getReader(self):
+        return self.reader.name
+
+    def connect(self, protocol=None, mode=None, disposition=None):
+        card = self.reader.card
+        if card is None or not card.present:
+            raise NoCardException("No card inserted")
+        self.card = card
+
+    def reconnect(self, protocol=None, mode=None, disposition=None):
+        self.connect()
+
+    def disconnect(self):
+        self.card = None
+
+    def transmit(self, command, protocol=None):
+        card = self.card
+        if card is None:
+            raise CardConnectionException("Not connected")
+        if card is not self.reader.card:
+            # Card swapped or removed under this handle, like SCARD_W_RESET_CARD.
+            raise CardConnectionException("Card was reset or removed")
+        return card.process(command)
+
+
+class SimulatedCard:
+    """What a CardMonitor would report for a tag on a SimulatedReader."""
+
+    def __init__(self, reader, atr=(0x3B, 0x8F, 0x80, 0x01)):
+        self.reader = reader.name
+        self.atr = list(atr)
+        self._reader = reader
+
+    def createConnection(self):
+        return self._reader.createConnection()
+
+
+class SimulatedReader:
+    """A reader slot that tags can be placed on and taken off."""
+
+    def __init__(self, name="Simulated NTAG Reader 0", card=None):
+        self.name = name
+        self.card = card
+
+    def __str__(self):
+        return self.name
+
+    def createConnection(self):
+        return SimulatedConnection(self)
+
+    def insert(self, card) -> SimulatedCard:
+        """Places ``card`` on the reader and returns the monitor-style event."""
+        self.card = card
+        return SimulatedCard(self)
+
+    def remove(self):
+        self.card = None
@@ -0,0 +1,147 @@
+"""Tag handling shared by the wx front ends (new.py and nfc_code.py)."""
+import sys
+import time
+
+from smartcard.CardMonitoring import CardObserver
+from smartcard.System import readers
+from smartcard.util import toHexString
+
+from audit import audit
+from batch import details_fields
+from dispatcher import ReaderDispatcher
+from journal import journal, write_resumable
+from ntag import create_compact_record, create_ndef_record, image_digest, verify_ndef_digest, write_ndef_message
+from presence import ReaderPresence
+from recent import recent_tags
+from session import sessions
+from tagcache import tag_cache
+from uid_list import UIDListError, load_access_control
+
+
+#  Accepted when no NFC_ALLOWLIST file is configured
+EXPECTED_UID = "1DD94F118D0000"
+
+
+def load_access():
+    """Loads the allow/deny lists at startup; exits with the reason if one is unusable."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    try:
+        return load_access_control([EXPECTED_UID])
+    except UIDListError as e:
+        sys.exit(f"NFC Tool: {e}")
+
+
+class NTAG215Observer(CardObserver):
+    """Handles the tags tapped while a WriteNFCFrame is open.
+
+    ``app`` is the frame: the workers read its ``ui`` snapshot and post
+    results back through it. ``access`` decides which tags may be used.
+    """
+
+    def __init__(self, app, access):
+        self.app = app
+        self.access = access
+        # One worker per reader so tags on different readers are handled in parallel
+        self.dispatcher = ReaderDispatcher(self.handle_card, self.on_event, readers())
+        # A detached reader's worker is stopped instead of idling forever
+        self.reader_presence = ReaderPresence(self.dispatcher.readers_changed)
+        self.reader_presence.start()
+
+    def update(self, observable, actions):
+        """Hands each new card to its reader's worker."""
+        addedcards, _ = actions
+        for card in addedcards:
+            self.dispatcher.submit(card.reader, card)
+
+    def on_event(self, event):
+        """Reports a worker's result on the status label."""
+        # Keyed per reader so a burst on one reader does not drop another's result
+        self.app.ui.post(("status", event.reader), self.app.update_reader_status, event.reader, event.message)
+
+    def handle_card(self, reader_name, card):
+        """Handles the NFC card detection and writing process."""
+        started = time.perf_counter()
+        # Reuse the reader's warm connection instead of opening one per tap
+        session = sessions.get(reader_name)
+
+        # Read NFC tag UID
+        uid_command = [0xFF, 0xCA, 0x00, 0x00, 0x00]
+        response, sw1, sw2 = session.transmit(uid_command)
+        tag_uid = toHexString(response).replace(" ", "").upper()
+
+        # Widgets and their attributes belong to the GUI thread; use its snapshot
+        form = self.app.ui.snapshot()
+        if not self.access.is_allowed(bytes(response)):
+            self.log_audit(response, form, None, {}, started, "denied")
+            return "Wrong NFC tag! Access Denied."
+
+        if form["read_requested"]:
+            # A tag we wrote or read recently costs one or two APDUs here
+            stats = {}
+            records = tag_cache.read_ndef_records(session, response, stats)
+            self.log_audit(response, form, None, stats, started, "read")
+            if records is None:
+                return "No NDEF message found on tag."
+            self.app.ui.post("records", self.app.show_records, records)
+            return None
+
+        uid = bytes(response)
+        force = form["force"]
+
+        batch = form["batch"]
+        if batch is not None:
+            if not force and recent_tags.seen(uid):
+                return None  # Same tag bouncing in the field; it already got its row
+            written, message = batch.write_next(session, tag_uid, diff=form["diff"])
+            if written:
+                recent_tags.remember(uid)
+            return message
+
+        # Get text from the text box
+        data = form["text"]
+        if not data:
+            return "No text entered. Please enter text."
+
+        # Convert text to NDEF message
+        if form["compact"]:
+            ndef_message = create_compact_record(details_fields(data), "dictionary")
+        else:
+            ndef_message = create_ndef_record(data)
+        digest = image_digest(ndef_message)
+        if not force and recent_tags.seen(uid, digest):
+            return None  # Just wrote this payload to this tag
+
+        verify = form["verify"]
+        stats = {}
+        if verify and verify_ndef_digest(session, ndef_message, stats):
+            recent_tags.remember(uid, digest)
+            tag_cache.put(uid, ndef_message)
+            self.log_audit(uid, form, ndef_message, stats, started, "verified")
+            return "Tag already holds this data (verified)."
+
+        # Write to NFC tag
+        result = "error"
+        try:
+            if form["diff"]:
+                written = write_ndef_message(session, ndef_message, stats, diff=True, verify=verify)
+            else:
+                # Journaled so a tag pulled away mid-write resumes on the next tap
+                written = write_resumable(session, uid, ndef_message, journal, stats, verify=verify)
+            result = "written" if written else "failed"
+        finally:
+            if result == "written":
+                tag_cache.put(uid, ndef_message)
+            else:
+                tag_cache.forget(uid)
+            self.log_audit(uid, form, ndef_message, stats, started, result)
+        if written:
+            recent_tags.remember(uid, digest)
+            return f"Data written successfully! ({stats['apdus']} APDUs)"
+        return "Failed to write to NFC tag. Tap again to resume."
+
+    def log_audit(self, uid, form, ndef_message, stats, started, result):
+        """Queues an audit record for this tap; never waits on the disk."""
+        audit.record(uid, result, form.get("operator", ""), form.get("patient_id", ""), form.get("device_id", ""),
+                     ndef_message, stats.get("apdus"), time.perf_counter() - started)
@@ -0,0 +1,109 @@
+"""Last known NDEF image per tag UID, so repeat reads skip the memory dump."""
+import collections
+import os
+import threading
+
+import ndef
+
+from ntag import (CC_PAGE, DEFAULT_TAG, DIGEST_PAGES, DIGEST_SIZE, PAGE_SIZE, READ_BINARY_PAGES,
+                  USER_START_PAGE, PageReader, digest_page, parse_tlv, read_ndef_image, tag_info_from_cc)
+
+
+# Tags remembered at most; the least recently used are dropped first.
+MAX_ENTRIES = int(os.getenv("NFC_TAG_CACHE_SIZE", "512"))
+
+
+class TagCache:
+    """Bounded LRU of ``uid -> page image`` from our own writes and reads.
+
+    The image is the user memory as it was written or read, from the first
+    user page up to the end of the NDEF TLV. A new entry is checked against
+    every page it covers once, and the tag's fingerprint (the block from the
+    CC page on, holding the TLV header, plus the digest pages) is recorded.
+    After that a hit costs those two reads, whatever the image size; a
+    rewrite that leaves both the header and the digest alone goes unseen.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid):
+        """Returns ``(image, fingerprint)`` for the tag, or None."""
+        with self.lock:
+            entry = self.entries.get(bytes(uid))
+            if entry is not None:
+                self.entries.move_to_end(bytes(uid))
+            return entry
+
+    def put(self, uid, image, fingerprint=None):
+        """Remembers the page image now on the tag with this UID."""
+        with self.lock:
+            self.entries[bytes(uid)] = (bytes(image), fingerprint)
+            self.entries.move_to_end(bytes(uid))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forget(self, uid):
+        """Drops a tag whose content is no longer known, e.g. after a failed write."""
+        with self.lock:
+            self.entries.pop(bytes(uid), None)
+
+    @staticmethod
+    def fingerprint(reader):
+        """Reads the CC block and the digest pages; None if either is unreadable."""
+        head = reader.read_block(CC_PAGE, READ_BINARY_PAGES)
+        if head is None:
+            return None
+        tag_info = tag_info_from_cc(head[:PAGE_SIZE]) or DEFAULT_TAG
+        tail = reader.read_block(digest_page(tag_info), DIGEST_PAGES)
+        if tail is None:
+            return None
+        return head[:READ_BINARY_PAGES * PAGE_SIZE] + tail[:DIGEST_SIZE]
+
+    @staticmethod
+    def matches(reader, image) -> bool:
+        """Reads the pages ``image`` covers and checks they are unchanged."""
+        data = reader.read(USER_START_PAGE, len(image))
+        return data is not None and data[:len(image)] == image
+
+    def read_ndef_message(self, connection, uid, stats=None):
+        """ntag.read_ndef_message(), answered from the cache when the tag still matches."""
+        entry = self.get(uid)
+        reader = PageReader(connection)
+        if entry is not None:
+            image, fingerprint = entry
+            current = self.fingerprint(reader)
+            if current is not None and fingerprint is None and self.matches(reader, image):
+                # First repeat read: the whole image matched, so pin the fingerprint.
+                self.put(uid, image, current)
+                fingerprint = current
+            if current is not None and current == fingerprint:
+                self.hits += 1
+                if stats is not None:
+                    stats["apdus"] = reader.apdus
+                    stats["cached"] = True
+                return parse_tlv(image)[1]
+            self.forget(uid)
+        self.misses += 1
+        data, message = read_ndef_image(connection, stats)
+        if message is not None:
+            self.put(uid, data)
+        if stats is not None:
+            stats["cached"] = False
+            stats["apdus"] += reader.apdus
+        return message
+
+    def read_ndef_records(self, connection, uid, stats=None):
+        """Decoded records, like ntag.read_ndef_records(), or None if unreadable."""
+        message = self.read_ndef_message(connection, uid, stats)
+        if message is None:
+            return None
+        return list(ndef.message_decoder(message))
+
+
+# Shared by the front ends.
+tag_cache = TagCache()
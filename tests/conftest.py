@@ -0,0 +1,41 @@
+"""Shared fixtures: a simulated NTAG215 on a simulated reader."""
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep test writes out of the audit database.
+os.environ["NFC_AUDIT_DB"] = ""
+
+try:
+    import smartcard  # noqa: F401
+except ImportError:
+    # No pyscard here: the simulator does not need PC/SC, only its names.
+    from pyscard_stub import install
+
+    install()
+
+
+@pytest.fixture
+def tag():
+    from simulator import SimulatedNTAG215
+
+    return SimulatedNTAG215()
+
+
+@pytest.fixture
+def reader(tag):
+    from simulator import SimulatedReader
+
+    return SimulatedReader("Sim 0", tag)
+
+
+@pytest.fixture
+def session(reader):
+    from session import ReaderSession
+
+    session = ReaderSession(reader.name, reader)
+    yield session
+    session.disconnect()
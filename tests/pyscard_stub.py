@@ -0,0 +1,91 @@
+"""Stand-in for the parts of pyscard the modules import, for runs without it.
+
+Only the names the code imports are defined. The simulator supplies every
+APDU, so the exception classes and scard constants are all the tests need.
+PC/SC calls report that no PC/SC service is running.
+"""
+import sys
+import types
+
+SCARD_CONSTANTS = {
+    "SCARD_S_SUCCESS": 0x0,
+    "SCARD_E_CANCELLED": 0x80100002,
+    "SCARD_E_UNKNOWN_READER": 0x80100009,
+    "SCARD_E_TIMEOUT": 0x8010000A,
+    "SCARD_E_READER_UNAVAILABLE": 0x80100017,
+    "SCARD_E_NO_SERVICE": 0x8010001D,
+    "SCARD_SCOPE_USER": 0,
+    "SCARD_LEAVE_CARD": 0,
+    "SCARD_STATE_UNAWARE": 0x0000,
+    "SCARD_STATE_CHANGED": 0x0002,
+    "SCARD_STATE_UNKNOWN": 0x0004,
+    "SCARD_STATE_EMPTY": 0x0010,
+    "SCARD_STATE_PRESENT": 0x0020,
+    "INFINITE": 0xFFFFFFFF,
+}
+
+
+class SmartcardException(Exception):
+    pass
+
+
+class CardConnectionException(SmartcardException):
+    pass
+
+
+class NoCardException(SmartcardException):
+    pass
+
+
+class CardRequestTimeoutException(SmartcardException):
+    pass
+
+
+class _Observer:
+    def update(self, observable, actions):
+        pass
+
+
+class _Monitor:
+    def addObserver(self, observer):
+        pass
+
+    def deleteObserver(self, observer):
+        pass
+
+
+class PCSCReader:
+    def __init__(self, name):
+        self.name = name
+
+    def createConnection(self):
+        raise NoCardException("No PC/SC service")
+
+
+def _no_service(*args):
+    return SCARD_CONSTANTS["SCARD_E_NO_SERVICE"], None
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    """Registers the stand-in ``smartcard`` modules in sys.modules."""
+    exceptions = dict(SmartcardException=SmartcardException, CardConnectionException=CardConnectionException,
+                      NoCardException=NoCardException, CardRequestTimeoutException=CardRequestTimeoutException)
+    scard = _module("smartcard.scard", **SCARD_CONSTANTS, SCardEstablishContext=_no_service,
+                    SCardGetStatusChange=lambda *args: (SCARD_CONSTANTS["SCARD_E_NO_SERVICE"], []),
+                    SCardListReaders=_no_service, SCardCancel=lambda context: 0,
+                    SCardReleaseContext=lambda context: 0)
+    _module("smartcard", scard=scard, __path__=[])
+    _module("smartcard.Exceptions", **exceptions)
+    _module("smartcard.System", readers=lambda: [])
+    _module("smartcard.CardMonitoring", CardMonitor=_Monitor, CardObserver=_Observer)
+    _module("smartcard.ReaderMonitoring", ReaderMonitor=_Monitor, ReaderObserver=_Observer)
+    _module("smartcard.pcsc", __path__=[])
+    _module("smartcard.pcsc.PCSCReader", PCSCReader=PCSCReader)
+    _module("smartcard.util", toHexString=lambda data: " ".join(f"{byte:02X}" for byte in data))
@@ -0,0 +1,43 @@
+"""BatchJob hand-out order, targeted rows and precompiled image files."""
+import pytest
+
+from batch import BatchJob
+from images import TagImageFile, compile_rows
+from ntag import format_records, read_ndef_records
+
+ROWS = [
+    {"patient_id": "1001", "zip_code": "02139", "device_id": "D-1"},
+    {"patient_id": "1002", "zip_code": "02139", "device_id": "D-2", "uid": "04A1B2C3D4E5F6"},
+    {"patient_id": "1003", "zip_code": "02139", "device_id": "D-3"},
+]
+
+
+@pytest.fixture(params=["rows", "image"])
+def batch(request, tmp_path):
+    if request.param == "rows":
+        yield BatchJob([dict(row) for row in ROWS])
+        return
+    path = str(tmp_path / "job.nfcimg")
+    compile_rows(ROWS, path, workers=1)
+    batch = BatchJob([], images=TagImageFile(path))
+    yield batch
+    batch.messages.close()
+
+
+def test_targeted_row_is_written_once_and_counted(session, tag, batch):
+    uid = tag.uid.hex().upper()
+    assert batch.remaining() == 3
+    assert batch.write_next(session, uid)[0]
+    assert "Patient ID: 1002" in format_records(read_ndef_records(session))
+    assert batch.remaining() == 2
+    # The next tap of the same tag gets an untargeted row, not the same one again.
+    assert batch.write_next(session, uid)[0]
+    assert "Patient ID: 1001" in format_records(read_ndef_records(session))
+    assert batch.write_next(session, uid)[0]
+    assert batch.remaining() == 0
+    assert batch.write_next(session, uid) == (False, "Batch complete. No rows left.")
+
+
+def test_rows_keep_their_audit_details(batch):
+    assert batch.row(1)["patient_id"] == "1002"
+    assert batch.row(1)["device_id"] == "D-2"
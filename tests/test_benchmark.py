@@ -0,0 +1,29 @@
+"""APDU counts of the benchmark paths; a change here changes tags per minute."""
+import pytest
+
+import benchmark
+
+
+@pytest.mark.parametrize("path, size, apdus", [
+    # UID + CC read + one APDU a page (7 pages for 16 characters, 104 for 400).
+    ("per_page", 16, 9),
+    ("per_page", 400, 106),
+    # UID + CC read + four pages per FAST_WRITE frame.
+    ("fast_write", 16, 4),
+    ("fast_write", 400, 28),
+])
+def test_write_apdus(path, size, apdus):
+    result = benchmark.bench_write(path, size, taps=3, latency=0.0)
+    assert result["apdus"] == apdus
+
+
+@pytest.mark.parametrize("path", ["per_page", "fast_write"])
+def test_write_mode_is_chosen_on_the_first_tap_only(path):
+    result = benchmark.bench_write(path, 16, taps=3, latency=0.0)
+    # Refused multi-block attempt on the NTAG215, GET_VERSION on the NTAG I2C.
+    assert result["first_tap_apdus"] == result["apdus"] + 1
+
+
+def test_uid_check_is_one_apdu():
+    result = benchmark.bench_uid_check(taps=3, latency=0.0)
+    assert result["apdus"] == 1
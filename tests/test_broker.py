@@ -0,0 +1,94 @@
+"""Broker requests on a simulated reader, over a real Unix socket."""
+import os
+import socket
+import threading
+
+import pytest
+
+if not hasattr(socket, "AF_UNIX"):
+    pytest.skip("needs Unix sockets", allow_module_level=True)
+
+import broker  # noqa: E402
+from ntag import create_ndef_record, write_ndef_message  # noqa: E402
+from session import sessions  # noqa: E402
+from uid_list import AccessControl, UIDList  # noqa: E402
+
+
+@pytest.fixture
+def attached(reader):
+    session = sessions.attach(reader)
+    yield session
+    sessions.close(reader.name)
+
+
+@pytest.fixture
+def client(tmp_path, attached, reader):
+    path = str(tmp_path / "broker.sock")
+    server = broker._Server(path, broker._Handler)
+    server.broker = broker.Broker(AccessControl(UIDList()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = broker.BrokerClient(path, timeout=5)
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+    server.broker.stop()
+
+
+def test_uid_is_open_but_reads_need_an_allowed_tag(client, attached, reader, tag):
+    write_ndef_message(attached, create_ndef_record("private"))
+    assert client.call("uid", reader=reader.name)["uid"] == tag.uid.hex().upper()
+    with pytest.raises(broker.BrokerError, match="Access Denied"):
+        client.call("read", reader=reader.name)
+
+
+def test_bad_requests_get_an_error_reply(client, reader):
+    with pytest.raises(broker.BrokerError, match="priority"):
+        client.call("uid", reader=reader.name, priority="high")
+    # Not an object: answered without an id, and the connection keeps working.
+    client.sock.sendall(b"[1, 2]\n")
+    assert client.call("readers") == []
+
+
+def test_pending_calls_fail_when_the_connection_closes(client):
+    waiter = [threading.Event()]
+    client.replies[999] = waiter  # A call the broker never answered
+    client.sock.shutdown(socket.SHUT_RDWR)
+    assert waiter[0].wait(5) and not waiter[1]["ok"]
+    with pytest.raises(broker.BrokerError, match="closed"):
+        client.call("readers", timeout=5)
+
+
+def test_stale_socket_is_removed_but_a_live_one_is_kept(tmp_path):
+    path = str(tmp_path / "stale.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    broker._remove_stale_socket(path)
+    assert not os.path.exists(path)
+
+    live = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    live.bind(path)
+    live.listen()
+    try:
+        with pytest.raises(broker.BrokerError, match="already running"):
+            broker._remove_stale_socket(path)
+        assert os.path.exists(path)
+    finally:
+        live.close()
+
+
+def test_unknown_reader_gets_no_queue(client):
+    with pytest.raises(broker.BrokerError, match="Unknown reader"):
+        client.call("uid", reader="No Such Reader")
+
+
+def test_detached_reader_queue_is_stopped(attached, reader):
+    owner = broker.Broker()
+    reader_queue = owner.queue_for(reader.name)
+    owner.readers_changed([], [reader.name])
+    reader_queue.join(5)
+    assert not reader_queue.is_alive() and reader.name not in owner.queues
+    with pytest.raises(broker.BrokerError, match="Unknown reader"):
+        owner.request("uid", {"reader": reader.name}, timeout=5)
@@ -0,0 +1,72 @@
+"""nfc_cli commands against a simulated reader."""
+import pytest
+
+import nfc_cli
+from session import sessions
+from uid_list import AccessControl, UIDList
+
+
+@pytest.fixture
+def cli(monkeypatch, reader, tag):
+    sessions.attach(reader)
+    monkeypatch.setattr(nfc_cli, "wait_for_card", lambda timeout, new_card_only=False: reader.name)
+    monkeypatch.setattr(nfc_cli, "load_access", lambda: AccessControl(UIDList(uids=[tag.uid])))
+    yield nfc_cli.main
+    sessions.close(reader.name)
+
+
+def test_compact_write_then_verify(cli, capsys):
+    text = "Patient ID: 1234\nZIP Code: 02139\nDevice ID: PX-7"
+    assert cli(["write", text, "--compact", "--verify"]) == 0
+    assert cli(["verify", text, "--compact"]) == 0
+    assert cli(["verify", text]) == 1
+    assert "Tag verified." in capsys.readouterr().out
+
+
+def test_oversize_write_is_reported(cli, capsys):
+    assert cli(["write", "x" * 600]) == 1
+    assert "holds 496" in capsys.readouterr().err
+
+
+def test_failed_uid_read_is_reported(cli, tag, capsys):
+    tag.errors = {tag.apdus: (0x6A, 0x81)}
+    assert cli(["uid"]) == 1
+    assert "UID read failed (6A 81)" in capsys.readouterr().err
+
+
+def test_read_checks_the_allowlist(cli, monkeypatch, capsys):
+    monkeypatch.setattr(nfc_cli, "load_access", lambda: AccessControl(UIDList(uids=[b"\x04" * 7])))
+    assert cli(["read"]) == 1
+    assert "Access Denied" in capsys.readouterr().err
+
+
+def test_tag_taken_away_during_a_write_is_reported(cli, tag, capsys):
+    tag.remove_after = tag.apdus + 3
+    assert cli(["write", "x" * 100]) == 1
+    assert "No card inserted" in capsys.readouterr().err
+
+
+def test_unreadable_batch_file_is_reported(cli, tmp_path, capsys):
+    assert cli(["batch", str(tmp_path / "missing.csv")]) == 1
+    assert "Cannot load" in capsys.readouterr().err
+
+
+def test_batch_with_nothing_left_returns_at_once(cli, tmp_path, capsys):
+    jobfile = tmp_path / "done.csv"
+    jobfile.write_text("patient_id,zip_code,device_id\n")
+    assert cli(["batch", str(jobfile)]) == 0
+    assert "0 tags to write" in capsys.readouterr().out
+
+
+def test_every_tag_access_is_audited(cli, monkeypatch):
+    import audit
+
+    results = []
+    monkeypatch.setattr(audit.audit, "record", lambda uid, result, *args, **kwargs: results.append(result))
+    assert cli(["uid"]) == 0
+    assert cli(["write", "hello", "--verify"]) == 0
+    assert cli(["read"]) == 0
+    assert cli(["verify", "hello"]) == 0
+    monkeypatch.setattr(nfc_cli, "load_access", lambda: AccessControl(UIDList(uids=[b"\x04" * 7])))
+    assert cli(["read"]) == 1
+    assert results == ["uid_read", "written", "read", "verified", "denied"]
@@ -0,0 +1,19 @@
+"""ReaderDispatcher workers follow their readers."""
+import queue
+
+from dispatcher import ReaderDispatcher
+
+
+def test_detached_reader_worker_is_stopped_and_removed():
+    events = queue.Queue()
+    dispatcher = ReaderDispatcher(lambda reader_name, card: f"{reader_name} {card}", events.put)
+    dispatcher.readers_changed(["Sim 0", "Sim 1"], [])
+    worker = dispatcher.workers["Sim 0"]
+    dispatcher.submit("Sim 0", "tag")
+    assert events.get(timeout=5).message == "Sim 0 tag"
+
+    dispatcher.readers_changed([], ["Sim 0"])
+    assert not worker.is_alive()
+    assert list(dispatcher.workers) == ["Sim 1"]
+    dispatcher.stop()
+    assert not dispatcher.workers
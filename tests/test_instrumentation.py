@@ -0,0 +1,27 @@
+"""Status words recorded by InstrumentedConnection."""
+from instrumentation import InstrumentedConnection, Metrics
+from ntag import COMMUNICATE_THRU, DIRECT_TRANSMIT, FAST_READ
+
+
+class FixedReply:
+    def __init__(self, response):
+        self.response = response
+
+    def transmit(self, command):
+        return self.response, 0x90, 0x00
+
+
+def recorded_status(command, response):
+    metrics = Metrics()
+    InstrumentedConnection(FixedReply(response), "Sim 0", metrics).transmit(command)
+    return [sw for (_, _, sw) in metrics.status]
+
+
+def test_direct_transmit_records_the_tag_status():
+    command = DIRECT_TRANSMIT + [5] + COMMUNICATE_THRU + [FAST_READ, 4, 7]
+    assert recorded_status(command, [0xD5, 0x43, 0x01]) == ["9000/01"]
+
+
+def test_page_data_starting_with_d5_is_not_a_tag_status():
+    # READ BINARY of user memory that happens to start with D5 xx non-zero.
+    assert recorded_status([0xFF, 0xB0, 0x00, 4, 16], [0xD5, 0x10, 0x22] + [0] * 13) == ["9000"]
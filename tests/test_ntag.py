@@ -0,0 +1,110 @@
+"""Write/read round trips against the simulated NTAG215."""
+import pytest
+
+from smartcard.Exceptions import SmartcardException
+
+from journal import WriteJournal, write_resumable
+from ntag import (CC_PAGE, PAGE_SIZE, CapacityError, create_compact_record, create_ndef_record, format_records,
+                  image_digest, parse_tlv, read_ndef_message, read_ndef_records, verify_ndef_digest,
+                  write_ndef_message)
+
+
+@pytest.mark.parametrize("text", ["hi", "x" * 100, "Patient ID: 1234\nZIP Code: 90210\n" * 10])
+def test_text_round_trip(session, tag, text):
+    ndef_message = create_ndef_record(text)
+    assert write_ndef_message(session, ndef_message)
+    assert format_records(read_ndef_records(session)) == text
+    assert tag.user_data().startswith(ndef_message)
+
+
+def test_compact_round_trip(session):
+    fields = {"patient_id": "1234", "zip_code": "02139", "device_id": "PX-7"}
+    assert write_ndef_message(session, create_compact_record(fields, "dictionary"))
+    assert format_records(read_ndef_records(session)) == "Patient ID: 1234\nZIP Code: 02139\nDevice ID: PX-7"
+
+
+def test_diff_write_rewrites_changed_pages_only(session):
+    write_ndef_message(session, create_ndef_record("a" * 200))
+    stats = {}
+    assert write_ndef_message(session, create_ndef_record("a" * 199 + "b"), stats, diff=True)
+    assert stats["pages"] == 1
+    assert format_records(read_ndef_records(session)) == "a" * 199 + "b"
+
+
+def test_oversize_image_raises_before_writing(session, tag):
+    before = tag.user_data()
+    with pytest.raises(CapacityError):
+        write_ndef_message(session, create_ndef_record("x" * 600))
+    assert tag.user_data() == before
+
+
+def test_removal_mid_write_leaves_empty_tag_and_resumes(session, tag):
+    ndef_message = create_ndef_record("y" * 300)
+    journal = WriteJournal()
+    uid = tag.uid
+    tag.remove_after = 6
+    with pytest.raises(SmartcardException):
+        write_resumable(session, uid, ndef_message, journal)
+    assert journal.get(uid, image_digest(ndef_message)) is not None
+
+    # Back on the reader: a half-written tag reads as empty, not corrupt.
+    tag.remove_after = None
+    assert read_ndef_message(session) == b""
+
+    stats = {}
+    assert write_resumable(session, uid, ndef_message, journal, stats)
+    assert stats["resumed_from"] is not None
+    assert parse_tlv(tag.user_data())[1] == read_ndef_message(session)
+    assert format_records(read_ndef_records(session)) == "y" * 300
+
+
+def test_interleaved_interrupted_writes_do_not_resume_the_older_one(session, tag):
+    first, second = create_ndef_record("a" * 300), create_ndef_record("b" * 300)
+    journal = WriteJournal()
+    for ndef_message in (first, second):
+        tag.remove_after = tag.apdus + 8
+        with pytest.raises(SmartcardException):
+            write_resumable(session, tag.uid, ndef_message, journal)
+        tag.remove_after = None
+    # The second write overwrote the pages the first one had journaled.
+    assert journal.get(tag.uid, image_digest(first)) is None
+    stats = {}
+    assert write_resumable(session, tag.uid, first, journal, stats)
+    assert stats["resumed_from"] is None
+    assert format_records(read_ndef_records(session)) == "a" * 300
+
+
+def test_full_ntag213_diff_write_keeps_the_last_pages(session, tag):
+    tag.memory[CC_PAGE * PAGE_SIZE + 2] = 0x12  # NTAG213: 144-byte NDEF area
+    # 134 characters make a 144-byte image, reaching into the digest pages.
+    full = create_ndef_record("a" * 134)
+    assert len(full) == 144
+    assert write_ndef_message(session, full)
+    assert write_ndef_message(session, create_ndef_record("a" * 133 + "b"), diff=True)
+    assert format_records(read_ndef_records(session)) == "a" * 133 + "b"
+    with pytest.raises(CapacityError):
+        write_ndef_message(session, full, verify=True)
+
+
+@pytest.mark.parametrize("diff", [False, True])
+def test_unverified_write_does_not_pass_an_older_digest(session, diff):
+    first, second = create_ndef_record("first"), create_ndef_record("second")
+    assert write_ndef_message(session, first, verify=True)
+    assert verify_ndef_digest(session, first)
+    assert write_ndef_message(session, second, diff=diff)
+    assert not verify_ndef_digest(session, first)
+    assert not verify_ndef_digest(session, second)
+
+
+def test_interrupted_resumable_write_does_not_pass_an_older_digest(session, tag):
+    first, second = create_ndef_record("first"), create_ndef_record("second" * 20)
+    journal = WriteJournal()
+    assert write_resumable(session, tag.uid, first, journal, verify=True)
+    tag.remove_after = tag.apdus + 6
+    with pytest.raises(SmartcardException):
+        write_resumable(session, tag.uid, second, journal)
+    tag.remove_after = None
+    assert not verify_ndef_digest(session, first)
+    assert write_resumable(session, tag.uid, second, journal)
+    assert not verify_ndef_digest(session, first)
+    assert format_records(read_ndef_records(session)) == "second" * 20
@@ -0,0 +1,18 @@
+"""PatientStore imports and lookups."""
+from patients import PatientRecord, PatientStore
+
+
+def test_import_accepts_numeric_jsonl_values(tmp_path):
+    store = PatientStore(str(tmp_path / "patients.db"))
+    rows = [{"patient_id": 1234, "zip_code": 2139, "device_id": " PX-7 "}, {"patient_id": None}]
+    assert store.import_rows(rows) == 1
+    assert store.lookup("1234") == PatientRecord("1234", "2139", "PX-7")
+
+
+def test_misses_are_not_cached(tmp_path):
+    store = PatientStore(str(tmp_path / "patients.db"))
+    store.import_rows([{"patient_id": "1234", "zip_code": "02139", "device_id": "PX-7"}])
+    for prefix in ("1", "12", "123"):
+        assert store.lookup(prefix) is None
+    assert store.lookup("1234") is not None
+    assert list(store.cache) == ["1234"]
@@ -0,0 +1,58 @@
+"""CardPresence falls back to polling only when PC/SC cannot report card state."""
+import pytest
+
+import presence
+from presence import CardPresence
+from smartcard import scard
+
+
+@pytest.fixture
+def status_changes(monkeypatch):
+    """Feeds SCardGetStatusChange results from a list."""
+    results = []
+    monkeypatch.setattr(presence.scard, "SCardEstablishContext", lambda scope: (scard.SCARD_S_SUCCESS, 1))
+    monkeypatch.setattr(presence.scard, "SCardGetStatusChange", lambda context, timeout, states: results.pop(0))
+    monkeypatch.setattr(presence, "POLL_MAX", 0.01)
+    return results
+
+
+def card_state(flags):
+    return scard.SCARD_S_SUCCESS, [("Sim 0", flags, [])]
+
+
+def test_unplugged_reader_is_retried_not_polled(status_changes):
+    status_changes += [(scard.SCARD_E_UNKNOWN_READER, []), card_state(scard.SCARD_STATE_PRESENT)]
+    card = CardPresence("Sim 0", probe=lambda name: pytest.fail("fell back to polling"))
+    assert card.wait(timeout=1)
+    assert not card._polling
+
+
+def test_no_service_falls_back_to_polling(status_changes):
+    status_changes.append((scard.SCARD_E_NO_SERVICE, []))
+    card = CardPresence("Sim 0", probe=lambda name: True)
+    assert card.wait(timeout=1)
+    assert card._polling
+
+
+def test_unsupported_state_falls_back_to_polling(status_changes):
+    status_changes.append(card_state(scard.SCARD_STATE_UNKNOWN))
+    card = CardPresence("Sim 0", probe=lambda name: True)
+    assert card.wait(timeout=1)
+    assert card._polling
+
+
+def test_known_state_is_refreshed_before_it_is_trusted(status_changes, monkeypatch):
+    timeouts = []
+    results = [card_state(scard.SCARD_STATE_PRESENT),
+               card_state(scard.SCARD_STATE_EMPTY | scard.SCARD_STATE_CHANGED),
+               card_state(scard.SCARD_STATE_PRESENT | scard.SCARD_STATE_CHANGED)]
+
+    def status_change(context, timeout, states):
+        timeouts.append(timeout)
+        return results.pop(0)
+    monkeypatch.setattr(presence.scard, "SCardGetStatusChange", status_change)
+    card = CardPresence("Sim 0", probe=lambda name: pytest.fail("fell back to polling"))
+    assert card.wait(timeout=1)
+    # The card was taken off since; the second wait has to notice and block.
+    assert card.wait(timeout=1)
+    assert timeouts[1] == 0 and timeouts[2] > 0
@@ -0,0 +1,86 @@
+"""ReaderSession behaviour when the tag under a warm handle changes."""
+import pytest
+
+from smartcard.Exceptions import CardConnectionException
+
+from ntag import (GET_UID_COMMAND, create_ndef_record, format_records, read_ndef_message, read_ndef_records,
+                  write_ndef_message)
+from simulator import SimulatedNTAG215, SimulatedNTAGI2C
+
+OTHER_UID = bytes.fromhex("04112233445566")
+
+
+def swap_after(reader, tag, apdus, other):
+    """Puts ``other`` on the reader once ``tag`` has answered ``apdus`` APDUs."""
+    process = tag.process
+
+    def swapping(apdu):
+        response = process(apdu)
+        if tag.apdus == apdus:
+            reader.insert(other)
+        return response
+    tag.process = swapping
+
+
+def test_uid_read_is_retried_after_a_swap(session, reader, tag):
+    session.transmit(GET_UID_COMMAND)
+    reader.insert(SimulatedNTAG215(uid=OTHER_UID))
+    response, sw1, sw2 = session.transmit(GET_UID_COMMAND)
+    assert bytes(response) == OTHER_UID and (sw1, sw2) == (0x90, 0x00)
+
+
+def test_write_is_not_replayed_on_a_swapped_tag(session, reader, tag):
+    other = SimulatedNTAG215(uid=OTHER_UID)
+    before = other.user_data()
+    # CC read and three page writes reach the first tag, then it is swapped.
+    swap_after(reader, tag, 4, other)
+    with pytest.raises(CardConnectionException):
+        write_ndef_message(session, create_ndef_record("z" * 100))
+    assert other.user_data() == before
+    # The handle is on the new tag for whatever the caller does next.
+    assert read_ndef_message(session) == b""
+
+
+def test_cc_read_is_not_resent_on_a_swapped_tag(session, reader, tag):
+    # The UID was checked on the first tag, then a second one is tapped.
+    session.transmit(GET_UID_COMMAND)
+    other = SimulatedNTAG215(uid=OTHER_UID)
+    before = other.user_data()
+    reader.insert(other)
+    with pytest.raises(CardConnectionException):
+        write_ndef_message(session, create_ndef_record("z" * 100))
+    assert other.user_data() == before
+
+
+def test_write_mode_is_remembered_for_the_same_tag(session, tag):
+    first, second = {}, {}
+    session.transmit(GET_UID_COMMAND)
+    write_ndef_message(session, create_ndef_record("one"), first)
+    session.transmit(GET_UID_COMMAND)
+    write_ndef_message(session, create_ndef_record("two"), second)
+    assert session.write_mode == "page"
+    # The refused multi-block attempt is paid once; FAST_WRITE is never sent.
+    assert first["apdus"] == second["apdus"] + 1
+
+
+def test_write_mode_is_chosen_again_for_another_tag(session, reader, tag):
+    session.transmit(GET_UID_COMMAND)
+    write_ndef_message(session, create_ndef_record("one"))
+    assert session.write_mode == "page"
+    reader.insert(SimulatedNTAGI2C(uid=OTHER_UID))
+    session.transmit(GET_UID_COMMAND)
+    stats = {}
+    assert write_ndef_message(session, create_ndef_record("two" * 20), stats)
+    assert stats["mode"] == "fast_write" and session.write_mode == "fast_write"
+    assert format_records(read_ndef_records(session)) == "two" * 20
+
+
+def test_transient_refusal_keeps_the_write_mode(session, tag):
+    tag.multi_block = True
+    # CC read, then the first multi-page write fails once.
+    tag.errors = {tag.apdus + 1: (0x63, 0x00)}
+    assert not write_ndef_message(session, create_ndef_record("x" * 40))
+    assert session.write_mode == "multi_block"
+    stats = {}
+    assert write_ndef_message(session, create_ndef_record("x" * 40), stats)
+    assert stats["mode"] == "multi_block"
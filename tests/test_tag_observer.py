@@ -0,0 +1,68 @@
+"""The GUI tag handler on a simulated reader, without a window."""
+import queue
+
+import pytest
+
+from ntag import format_records, read_ndef_records
+from session import sessions
+from tag_observer import NTAG215Observer
+from uid_list import AccessControl, UIDList
+
+FORM = dict(text="", diff=False, verify=False, compact=False, force=True, read_requested=False, batch=None)
+
+
+class FakeApp:
+    """Stands in for WriteNFCFrame: a form snapshot and a direct UI bus."""
+
+    def __init__(self, **form):
+        self.form = dict(FORM, **form)
+        self.ui = self
+        self.statuses = queue.Queue()
+        self.records = None
+
+    def snapshot(self):
+        return dict(self.form)
+
+    def post(self, key, func, *args):
+        func(*args)
+
+    def update_reader_status(self, reader, message):
+        self.statuses.put((reader, message))
+
+    def show_records(self, records):
+        self.records = records
+
+
+class Card:
+    def __init__(self, reader):
+        self.reader = reader
+
+
+@pytest.fixture
+def observer(reader, tag):
+    sessions.attach(reader)
+    app = FakeApp(text="from the form")
+    observer = NTAG215Observer(app, AccessControl(UIDList(uids=[tag.uid])))
+    yield observer
+    observer.reader_presence.stop()
+    observer.dispatcher.stop()
+    sessions.close(reader.name)
+
+
+def test_tapped_tag_gets_the_form_text(observer, reader):
+    observer.update(None, ([Card(reader.name)], []))
+    reader_name, message = observer.app.statuses.get(timeout=5)
+    assert reader_name == reader.name and message.startswith("Data written successfully!")
+    assert format_records(read_ndef_records(sessions.get(reader.name))) == "from the form"
+
+
+def test_read_request_shows_the_records(observer, reader):
+    observer.handle_card(reader.name, None)
+    observer.app.form["read_requested"] = True
+    assert observer.handle_card(reader.name, None) is None
+    assert format_records(observer.app.records) == "from the form"
+
+
+def test_tag_not_on_the_allowlist_is_refused(observer, reader):
+    observer.access = AccessControl(UIDList(uids=[b"\x04" * 7]))
+    assert observer.handle_card(reader.name, None) == "Wrong NFC tag! Access Denied."
@@ -0,0 +1,59 @@
+"""TagCache only answers from memory while the tag still holds the image."""
+import pytest
+
+from ntag import PAGE_SIZE, USER_START_PAGE, create_ndef_record, format_records, write_ndef_message
+from tagcache import TagCache
+
+
+def test_repeat_read_is_a_hit(session, tag):
+    cache = TagCache()
+    ndef_message = create_ndef_record("cached " * 20)
+    write_ndef_message(session, ndef_message)
+    cache.put(tag.uid, ndef_message)
+    # The first repeat read checks the whole image once.
+    assert format_records(cache.read_ndef_records(session, tag.uid)) == "cached " * 20
+    stats = {}
+    assert format_records(cache.read_ndef_records(session, tag.uid, stats)) == "cached " * 20
+    # After that a hit is the CC block and the digest pages only.
+    assert stats["cached"] and stats["apdus"] == 2
+
+
+def test_verified_rewrite_with_the_same_header_is_a_miss(session, tag):
+    cache = TagCache()
+    ndef_message = create_ndef_record("a" * 200)
+    write_ndef_message(session, ndef_message)
+    cache.put(tag.uid, ndef_message)
+    cache.read_ndef_records(session, tag.uid)
+    # Another station rewrites the record past its first block, with a digest.
+    write_ndef_message(session, create_ndef_record("a" * 20 + "b" * 180), verify=True)
+    stats = {}
+    text = format_records(cache.read_ndef_records(session, tag.uid, stats))
+    assert not stats["cached"]
+    assert text == "a" * 20 + "b" * 180
+
+
+def test_changed_image_is_a_miss_before_the_fingerprint_is_pinned(session, tag):
+    cache = TagCache()
+    ndef_message = create_ndef_record("a" * 200)
+    write_ndef_message(session, ndef_message)
+    cache.put(tag.uid, ndef_message)
+    # Rewritten mid-record before the next read; header and digest are unchanged.
+    offset = (USER_START_PAGE + 20) * PAGE_SIZE
+    tag.memory[offset:offset + PAGE_SIZE] = b"bbbb"
+    stats = {}
+    text = format_records(cache.read_ndef_records(session, tag.uid, stats))
+    assert not stats["cached"]
+    assert "bbbb" in text and len(text) == 200
+
+
+def test_image_with_a_lock_control_tlv(session, tag):
+    cache = TagCache()
+    message = create_ndef_record("locked")
+    # Lock Control TLV ahead of the NDEF TLV, as some tags ship formatted.
+    image = bytes([0x01, 0x03, 0xA0, 0x10, 0x44]) + message
+    start = USER_START_PAGE * PAGE_SIZE
+    tag.memory[start:start + len(image)] = image
+    assert format_records(cache.read_ndef_records(session, tag.uid)) == "locked"
+    stats = {}
+    assert format_records(cache.read_ndef_records(session, tag.uid, stats)) == "locked"
+    assert stats["cached"]
@@ -0,0 +1,49 @@
+"""UID lists: lookups, background reloads and unreadable files."""
+import os
+import time
+
+import pytest
+
+from uid_list import UIDList, UIDListError, load_access_control
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_changed_file_is_swapped_in_by_the_watcher(tmp_path):
+    path = tmp_path / "allow.txt"
+    path.write_text("04A1B2C3D4E5F6\n")
+    uids = UIDList(str(path), reload_interval=0.01)
+    try:
+        assert bytes.fromhex("04A1B2C3D4E5F6") in uids
+        path.write_text("04 11 22 33 44 55 66  # replacement tag\n")
+        os.utime(path, ns=(0, time.time_ns() + 10**9))
+        assert wait_for(lambda: bytes.fromhex("04112233445566") in uids)
+        assert bytes.fromhex("04A1B2C3D4E5F6") not in uids
+    finally:
+        uids.close()
+
+
+def test_bad_replacement_keeps_the_last_good_list(tmp_path):
+    path = tmp_path / "allow.txt"
+    path.write_text("04A1B2C3D4E5F6\n")
+    uids = UIDList(str(path))
+    path.write_text("not a uid\n")
+    os.utime(path, ns=(0, time.time_ns() + 10**9))
+    uids.reload_if_changed()
+    assert bytes.fromhex("04A1B2C3D4E5F6") in uids
+    uids.close()
+
+
+def test_missing_allowlist_is_a_clear_error(tmp_path, monkeypatch):
+    missing = str(tmp_path / "missing.txt")
+    monkeypatch.setenv("NFC_ALLOWLIST", missing)
+    monkeypatch.delenv("NFC_DENYLIST", raising=False)
+    with pytest.raises(UIDListError, match="Cannot read UID list .*missing.txt"):
+        load_access_control()
@@ -0,0 +1,67 @@
+"""Coalescing bridge between worker threads and the wx GUI thread."""
+import threading
+import time
+
+import wx
+
+
+# At most one redraw per this many seconds, however fast tags are tapped.
+MIN_INTERVAL = 0.05
+
+
+class UIBus:
+    """Collects UI updates from any thread and applies them on the GUI thread.
+
+    ``post(key, func, *args)`` keeps only the newest update per key, so a
+    burst of status messages becomes one SetLabel. Updates are applied in
+    one batch at most every ``interval`` seconds.
+
+    Widgets must not be read off the GUI thread either, so the GUI thread
+    publishes form values with ``set_snapshot()`` and workers read a copy
+    with ``snapshot()``.
+    """
+
+    def __init__(self, interval=MIN_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.scheduled = False
+        self.last_flush = 0.0
+        self.values = {}
+
+    def post(self, key, func, *args):
+        """Queues ``func(*args)``, replacing any pending update with the same key."""
+        with self.lock:
+            self.pending[key] = (func, args)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        wx.CallAfter(self._flush)
+
+    def _flush(self):
+        wait = self.last_flush + self.interval - time.monotonic()
+        if wait > 0:
+            wx.CallLater(int(wait * 1000) + 1, self._apply)
+        else:
+            self._apply()
+
+    def _apply(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.scheduled = False
+        self.last_flush = time.monotonic()
+        for func, args in pending.values():
+            try:
+                func(*args)
+            except RuntimeError:
+                pass  # Window was destroyed while the update was queued
+
+    def set_snapshot(self, **values):
+        """Publishes form values; call from the GUI thread."""
+        with self.lock:
+            self.values.update(values)
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the last published form values."""
+        with self.lock:
+            return dict(self.values)
@@ -0,0 +1,129 @@
+"""Tag UID allowlist/denylist keyed on raw UID bytes."""
+import os
+import threading
+
+
+# How often (seconds) the list file is checked for changes.
+RELOAD_CHECK_INTERVAL = 2.0
+
+# A packed .bin UID record is a length byte plus the UID zero-padded to 10 bytes.
+PACKED_UID_SIZE = 10
+PACKED_RECORD_SIZE = PACKED_UID_SIZE + 1
+
+
+def parse_uid(text) -> bytes:
+    """Turns ``"1D D9 4F..."`` / ``"1dd94f..."`` into raw UID bytes."""
+    return bytes.fromhex(text.replace(":", "").replace(" ", ""))
+
+
+def read_uid_file(path):
+    """Yields raw UIDs from a text file (one hex UID per line, ``#`` comments)
+    or from a packed ``.bin`` file of fixed-width records."""
+    if path.lower().endswith(".bin"):
+        with open(path, "rb") as f:
+            data = f.read()
+        for offset in range(0, len(data) - PACKED_RECORD_SIZE + 1, PACKED_RECORD_SIZE):
+            yield data[offset + 1:offset + 1 + data[offset]]
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield parse_uid(line)
+
+
+def write_packed_uid_file(path, uids):
+    """Writes UIDs as a packed ``.bin`` file (11 bytes per tag)."""
+    with open(path, "wb") as f:
+        for uid in uids:
+            uid = bytes(uid)
+            f.write(bytes([len(uid)]) + uid.ljust(PACKED_UID_SIZE, b"\x00"))
+
+
+class UIDListError(ValueError):
+    """Raised when a UID list file cannot be read or parsed."""
+
+
+class UIDList:
+    """Set of raw UIDs loaded from a file.
+
+    Membership is a hash-set lookup on the UID bytes. With a ``path`` a
+    background thread checks the file every ``reload_interval`` seconds and
+    swaps in a freshly built set when it changed, so a lookup never waits
+    on the disk.
+    """
+
+    def __init__(self, path=None, uids=(), reload_interval=RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.extra = frozenset(bytes(uid) for uid in uids)
+        self.uids = self.extra
+        self.mtime = None
+        self.stopped = threading.Event()
+        self.watcher = None
+        if path:
+            self.reload()
+            self.watcher = threading.Thread(target=self._watch, args=(reload_interval,),
+                                            name="uid-list-reload", daemon=True)
+            self.watcher.start()
+
+    def reload(self):
+        """Reads the file and swaps in the new set; raises UIDListError if it cannot."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            uids = frozenset(read_uid_file(self.path)) | self.extra
+        except OSError as e:
+            raise UIDListError(f"Cannot read UID list {self.path}: {e.strerror}") from e
+        except ValueError as e:
+            raise UIDListError(f"Bad UID in {self.path}: {e}") from e
+        # One assignment: a lookup sees either the whole old set or the new one.
+        self.uids = uids
+        self.mtime = mtime
+
+    def reload_if_changed(self):
+        """Reloads the file if it changed since the last load."""
+        try:
+            if os.stat(self.path).st_mtime_ns != self.mtime:
+                self.reload()
+        except (OSError, UIDListError):
+            pass  # Keep serving the last good list while the file is replaced
+
+    def _watch(self, interval):
+        while not self.stopped.wait(interval):
+            self.reload_if_changed()
+
+    def close(self):
+        """Stops watching the file."""
+        self.stopped.set()
+
+    def __contains__(self, uid):
+        return bytes(uid) in self.uids
+
+    def __len__(self):
+        return len(self.uids)
+
+
+class AccessControl:
+    """Allow/deny decision for a tag UID. The denylist always wins."""
+
+    def __init__(self, allowlist, denylist=None):
+        self.allowlist = allowlist
+        self.denylist = denylist
+
+    def is_allowed(self, uid) -> bool:
+        if self.denylist is not None and uid in self.denylist:
+            return False
+        return uid in self.allowlist
+
+
+def load_access_control(default_uids=()):
+    """Builds the access check from ``NFC_ALLOWLIST`` / ``NFC_DENYLIST``.
+
+    Without an allowlist file only ``default_uids`` are accepted. Raises
+    UIDListError if a configured file is missing or unreadable.
+    """
+    default_uids = [parse_uid(uid) for uid in default_uids]
+    allow_path = os.getenv("NFC_ALLOWLIST")
+    deny_path = os.getenv("NFC_DENYLIST")
+    allowlist = UIDList(allow_path, default_uids if not allow_path else ())
+    denylist = UIDList(deny_path) if deny_path else None
+    return AccessControl(allowlist, denylist)